@@ -1,9 +1,39 @@
 import os
+import re
+import errno
 import sys
+import fnmatch
 import filecmp
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import traceback
+from array import array
+from collections import deque, namedtuple, defaultdict
+from contextlib import contextmanager
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    # Python 2
+    from collections import Mapping
+
+import six
+from six.moves import queue
+from six.moves import cPickle as pickle
+
+try:
+    import asyncio
+    from concurrent import futures
+except ImportError:
+    # Python 2
+    asyncio = None
 
 import beets.util
 from beets import config
+from beets import ui
 from beets.ui import get_path_formats
 from beets.mediafile import TYPES
 from beets.plugins import BeetsPlugin
@@ -13,27 +43,1133 @@ from beets.util.functemplate import Template
 __version__ = '0.1.2'
 __author__ = 'Sami Barakat <sami@sbarakat.co.uk>'
 
+
+# A file found while scanning a source directory, along with the size and
+# mtime captured at the time
+Artifact = namedtuple('Artifact', ['path', 'size', 'mtime'])
+
+# A planned transfer of an artifact to its final, unique destination. The
+# digest is that of the source if one was computed while planning
+Transfer = namedtuple('Transfer', ['artifact', 'dest', 'digest'])
+
+
+class _DirEntry(object):
+    '''Minimal stand-in for os.DirEntry where os.scandir is unavailable.'''
+    def __init__(self, directory, name):
+        self.name = name
+        self.path = os.path.join(directory, name)
+
+    def is_dir(self):
+        return os.path.isdir(self.path)
+
+    def stat(self):
+        return os.stat(self.path)
+
+
+def _scandir(path):
+    if hasattr(os, 'scandir'):
+        return os.scandir(path)
+    return [_DirEntry(path, name) for name in os.listdir(path)]
+
+
+# Extensions of files handled by beets itself, never treated as artifacts
+MEDIA_EXTENSIONS = frozenset(beets.util.bytestring_path(u'.' + t)
+                             for t in TYPES)
+
+
+def _glob_to_regex(pattern):
+    '''Translates a glob pattern into a regular expression where * and ?
+    don't match path separators and ** matches across directories.
+    '''
+    regex = []
+    i = 0
+    while i < len(pattern):
+        if pattern[i:i + 2] == b'**':
+            regex.append(b'.*')
+            i += 2
+        elif pattern[i:i + 1] == b'*':
+            regex.append(b'[^/]*')
+            i += 1
+        elif pattern[i:i + 1] == b'?':
+            regex.append(b'[^/]')
+            i += 1
+        else:
+            regex.append(re.escape(pattern[i:i + 1]))
+            i += 1
+    return b''.join(regex) + br'\Z'
+
+
+class ArtifactMatcher(object):
+    '''Matches artifact paths, relative to the album directory, against the
+    configured extensions. Plain extensions such as .log are looked up in a
+    frozenset; glob patterns such as *.jpg or scans/** are compiled into a
+    single regular expression. Patterns without a / match the file name in
+    any directory. The pattern .* matches everything.
+    '''
+    def __init__(self, patterns):
+        patterns = [beets.util.bytestring_path(p) for p in patterns]
+
+        self.match_all = b'.*' in patterns
+        self.extensions = frozenset(
+            p for p in patterns
+            if p.startswith(b'.') and not re.search(br'[*?]', p))
+
+        path_globs = []
+        name_globs = []
+        for p in patterns:
+            if p == b'.*' or p in self.extensions:
+                continue
+            if b'/' in p:
+                path_globs.append(_glob_to_regex(p))
+            else:
+                name_globs.append(_glob_to_regex(p))
+
+        regex = []
+        if path_globs:
+            regex.append(b'(?:' + b'|'.join(path_globs) + b')')
+        if name_globs:
+            regex.append(b'(?:.*/)?(?:' + b'|'.join(name_globs) + b')')
+        self._regex = re.compile(b'|'.join(regex)) if regex else None
+
+    def __call__(self, path):
+        if self.match_all:
+            return True
+        if os.path.splitext(path)[1] in self.extensions:
+            return True
+        if self._regex is not None:
+            return self._regex.match(path.replace(os.sep.encode(), b'/')) \
+                is not None
+        return False
+
+
+def _mkdirall(path):
+    '''Like beets.util.mkdirall, but tolerates directories being created
+    concurrently by another worker.
+    '''
+    for ancestor in beets.util.ancestry(path):
+        if not os.path.isdir(beets.util.syspath(ancestor)):
+            try:
+                os.mkdir(beets.util.syspath(ancestor))
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise beets.util.FilesystemError(exc, 'create',
+                                                     (ancestor,))
+
+
+def _is_numbered_form(path, dest):
+    '''Whether path is dest, or dest with a number added by
+    DestinationCache.claim to make it unique.
+    '''
+    directory, name = os.path.split(path)
+    dest_dir, dest_name = os.path.split(dest)
+    if directory != dest_dir:
+        return False
+    if name == dest_name:
+        return True
+    base, ext = os.path.splitext(dest_name)
+    return re.match(re.escape(base) + br'\.\d+' + re.escape(ext) + br'\Z',
+                    name) is not None
+
+
+class DestinationCache(object):
+    '''Per-run cache of the names in each destination directory, including
+    those claimed by transfers that haven't been made yet, and of the
+    directories known to exist. Each directory is listed at most once, and
+    created directories are never checked again.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names = {}
+        self._dirs = set()
+
+    def _names_in(self, directory):
+        # Called with the lock held
+        names = self._names.get(directory)
+        if names is None:
+            try:
+                names = set(os.listdir(beets.util.syspath(directory)))
+                self._dirs.add(directory)
+            except OSError:
+                names = set()
+            self._names[directory] = names
+        return names
+
+    def exists(self, path):
+        '''Returns whether path exists or has been claimed.'''
+        directory, name = os.path.split(path)
+        with self._lock:
+            return name in self._names_in(directory)
+
+    def claim(self, path):
+        '''Returns a version of path that does not exist and hasn't been
+        claimed, and claims it.
+            - ripped from beets/util/__init__.py
+        '''
+        directory, name = os.path.split(path)
+        with self._lock:
+            names = self._names_in(directory)
+            if name in names:
+                base, ext = os.path.splitext(name)
+                match = re.search(br'\.(\d)+$', base)
+                if match:
+                    num = int(match.group(1))
+                    base = base[:match.start()]
+                else:
+                    num = 0
+                while name in names:
+                    num += 1
+                    name = base + u'.{0}'.format(num).encode() + ext
+            names.add(name)
+        return os.path.join(directory, name)
+
+    def release(self, path):
+        '''Records that a file has been moved away from path.'''
+        directory, name = os.path.split(path)
+        with self._lock:
+            if directory in self._names:
+                self._names[directory].discard(name)
+
+    def makedirs(self, path):
+        '''Creates the directories enclosing path, unless they are already
+        known to exist.
+        '''
+        directory = os.path.dirname(path)
+        with self._lock:
+            if directory in self._dirs:
+                return
+        _mkdirall(path)
+        with self._lock:
+            self._dirs.update(beets.util.ancestry(path))
+
+    def clear(self):
+        with self._lock:
+            self._names.clear()
+            self._dirs.clear()
+
+
+def _gather(loop, fs):
+    '''asyncio.gather that also works for an empty list of futures.'''
+    if fs:
+        return asyncio.gather(*fs)
+    future = loop.create_future()
+    future.set_result([])
+    return future
+
+
+# ioctl request number for cloning a file on Linux CoW filesystems
+FICLONE = 0x40049409
+
+
+def reflink(source, dest):
+    '''Clones source to dest so that they share data blocks, as on btrfs or
+    XFS. Raises OSError or IOError where the filesystem can't do this.
+    '''
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(errno.EOPNOTSUPP, 'reflinks are not supported')
+
+    with open(source, 'rb') as src:
+        with open(dest, 'wb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except (OSError, IOError):
+                dst.close()
+                os.remove(dest)
+                raise
+
+
+def fast_copy(source, dest, buffer_size=1024 * 1024, preallocate=False,
+              throttle=None):
+    '''Copies a plain file like beets.util.copy, failing if dest exists,
+    but lets the kernel move the data where it can: os.copy_file_range, then
+    os.sendfile, falling back to reads and writes of buffer_size bytes. The
+    destination can be preallocated to the source's size first. With a
+    Throttle, data is copied buffer_size bytes at a time at the throttle's
+    rate. Returns the name of the mechanism used.
+    '''
+    try:
+        src = os.open(beets.util.syspath(source), os.O_RDONLY)
+        try:
+            size = os.fstat(src).st_size
+            dst = os.open(beets.util.syspath(dest),
+                          os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            try:
+                if preallocate and size and hasattr(os, 'posix_fallocate'):
+                    try:
+                        os.posix_fallocate(dst, 0, size)
+                    except OSError:
+                        pass
+                return _copy_fd(src, dst, size, buffer_size, throttle)
+            except BaseException:
+                os.close(dst)
+                dst = None
+                os.remove(beets.util.syspath(dest))
+                raise
+            finally:
+                if dst is not None:
+                    os.close(dst)
+        finally:
+            os.close(src)
+    except (OSError, IOError) as exc:
+        raise beets.util.FilesystemError(exc, 'copy', (source, dest),
+                                         traceback.format_exc())
+
+
+def _copy_fd(src, dst, size, buffer_size, throttle=None):
+    for name in ('copy_file_range', 'sendfile'):
+        if not hasattr(os, name):
+            continue
+        copied = 0
+        try:
+            while copied < size:
+                count = size - copied
+                if throttle:
+                    count = min(count, buffer_size)
+                if name == 'copy_file_range':
+                    sent = os.copy_file_range(src, dst, count)
+                else:
+                    sent = os.sendfile(dst, src, copied, count)
+                if sent == 0:
+                    break
+                copied += sent
+                if throttle:
+                    throttle.consume(nbytes=sent)
+        except OSError as exc:
+            # Unsupported for these files; try the next mechanism unless
+            # data has already been written
+            if copied or exc.errno not in (errno.EXDEV, errno.ENOSYS,
+                                           errno.EINVAL, errno.EOPNOTSUPP,
+                                           errno.EBADF):
+                raise
+            continue
+        # sendfile doesn't advance the source offset. The file may also
+        # have grown since it was stat'd
+        os.lseek(src, copied, os.SEEK_SET)
+        _copy_buffered(src, dst, buffer_size, throttle)
+        return name
+
+    _copy_buffered(src, dst, buffer_size, throttle)
+    return 'buffered'
+
+
+def _copy_buffered(src, dst, buffer_size, throttle=None):
+    while True:
+        data = os.read(src, buffer_size)
+        if not data:
+            return
+        if throttle:
+            throttle.consume(nbytes=len(data))
+        while data:
+            written = os.write(dst, data)
+            data = data[written:]
+
+
+class Throttle(object):
+    '''Token buckets limiting transfers to a number of bytes and files per
+    second, shared by all the threads making them. Either rate may be None
+    for no limit. Up to a second's worth of tokens can build up while idle.
+    Callers take tokens before they have been earned and then sleep until
+    they would have been, so concurrent callers queue up for their share.
+    '''
+    def __init__(self, bytes_per_second=None, files_per_second=None):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        for name, rate in (('bytes', bytes_per_second),
+                           ('files', files_per_second)):
+            if rate:
+                # [rate, tokens, time of last refill]
+                self._buckets[name] = [float(rate), float(rate), time.time()]
+
+    def __bool__(self):
+        return bool(self._buckets)
+    __nonzero__ = __bool__
+
+    def consume(self, nbytes=0, files=0):
+        delay = 0
+        with self._lock:
+            now = time.time()
+            for name, amount in (('bytes', nbytes), ('files', files)):
+                bucket = self._buckets.get(name)
+                if bucket is None or not amount:
+                    continue
+                rate, tokens, last = bucket
+                tokens = min(rate, tokens + (now - last) * rate) - amount
+                bucket[1:] = [tokens, now]
+                if tokens < 0:
+                    delay = max(delay, -tokens / rate)
+        if delay:
+            time.sleep(delay)
+
+
+# ioprio_set(2) system call numbers, which glibc doesn't wrap
+IOPRIO_SET = {
+    'x86_64': 251,
+    'i386': 289,
+    'i686': 289,
+    'aarch64': 30,
+    'armv7l': 314,
+}
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1
+
+
+def idle_priority():
+    '''Lowers the CPU and I/O scheduling priority of the calling thread to
+    idle, so that its disk access only gets the time other processes leave
+    unused. Only Linux sets priorities per thread; elsewhere they would
+    apply to all of beets, so nothing is changed. Returns whether the I/O
+    priority was lowered.
+    '''
+    if not sys.platform.startswith('linux'):
+        return False
+
+    if hasattr(os, 'setpriority'):
+        try:
+            # The nice value of "process" 0 is the calling thread's
+            os.setpriority(os.PRIO_PROCESS, 0, 19)
+        except OSError:
+            pass
+
+    syscall = IOPRIO_SET.get(os.uname()[4])
+    if syscall is None:
+        return False
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.syscall(syscall, IOPRIO_WHO_PROCESS, 0,
+                            IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) == 0
+    except (ImportError, OSError, AttributeError):
+        return False
+
+
+class ScanLimitExceeded(Exception):
+    """Raised when a directory being scanned for artifacts is larger than
+    the configured limits allow.
+    """
+
+
+def scan_artifacts(path, ignore=(), skip_dir=None, max_depth=None,
+                   max_entries=None):
+    '''Walks path in the same case-insensitive sorted order as
+    beets.util.sorted_walk, yielding an Artifact for every file. File types,
+    sizes and mtimes are captured in a single os.scandir pass. Names matching
+    a glob pattern in ignore are skipped, as are subdirectories for which
+    skip_dir returns True and those more than max_depth levels down. Only
+    one directory's files are held in memory at a time, and a directory
+    with more than max_entries entries raises ScanLimitExceeded.
+    '''
+    path = beets.util.bytestring_path(path)
+    ignore = [beets.util.bytestring_path(i) for i in ignore]
+
+    dirs = []
+    files = []
+    try:
+        for count, entry in enumerate(_scandir(beets.util.syspath(path)), 1):
+            if max_entries is not None and count > max_entries:
+                raise ScanLimitExceeded(
+                    u'more than {0} entries in {1}'.format(
+                        max_entries, beets.util.displayable_path(path)))
+            if any(fnmatch.fnmatch(entry.name, pat) for pat in ignore):
+                continue
+            try:
+                if entry.is_dir():
+                    dirs.append(entry.name)
+                else:
+                    stat = entry.stat()
+                    files.append(Artifact(os.path.join(path, entry.name),
+                                          stat.st_size, stat.st_mtime))
+            except OSError:
+                # Vanished or dangling entries
+                continue
+    except OSError:
+        return
+
+    files.sort(key=lambda f: os.path.basename(f.path).lower())
+    for artifact in files:
+        yield artifact
+    del files
+
+    if max_depth is not None:
+        if max_depth <= 0:
+            return
+        max_depth -= 1
+
+    dirs.sort(key=bytes.lower)
+    for name in dirs:
+        subdir = os.path.join(path, name)
+        if skip_dir and skip_dir(subdir):
+            continue
+        for artifact in scan_artifacts(subdir, ignore, skip_dir, max_depth,
+                                       max_entries):
+            yield artifact
+
+
+def directory_fingerprint(path, ignore=(), extra=()):
+    '''Returns a digest of the names, sizes and mtimes of the entries in
+    path that could be artifacts, along with the strings in extra, or None
+    if the directory can't be read. Media files are left out as beets
+    rewrites them on import. Subdirectories are fingerprinted by their own
+    mtime, which changes when entries are added to or removed from them but
+    not when a file in them is changed in place.
+    '''
+    path = beets.util.bytestring_path(path)
+    ignore = [beets.util.bytestring_path(i) for i in ignore]
+
+    entries = []
+    try:
+        for entry in _scandir(beets.util.syspath(path)):
+            if any(fnmatch.fnmatch(entry.name, pat) for pat in ignore):
+                continue
+            try:
+                is_dir = entry.is_dir()
+                if (not is_dir and
+                        os.path.splitext(entry.name)[1] in MEDIA_EXTENSIONS):
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((entry.name, is_dir, stat.st_size, stat.st_mtime))
+    except OSError:
+        return None
+
+    sha = hashlib.sha1()
+    for name, is_dir, size, mtime in sorted(entries):
+        sha.update(name)
+        sha.update(repr((is_dir, size, mtime)).encode('ascii'))
+    for value in extra:
+        sha.update(b'\0' + value.encode('utf8'))
+    return sha.hexdigest()
+
+
+class QueuedAlbum(object):
+    '''An album's artifacts waiting to be processed. A session can queue a
+    great many artifacts, so rather than as Artifacts they are held as
+    names relative to the album's source directory, which is stored once,
+    with their sizes and mtimes packed into arrays.
+    '''
+    __slots__ = ('source', 'names', 'sizes', 'mtimes', 'mapping', 'seq',
+                 'fingerprint', 'move')
+
+    def __init__(self, source, artifacts, mapping, seq=None,
+                 fingerprint=None, move=False):
+        self.source = source
+        start = len(os.path.join(source, b''))
+        self.names = tuple(a.path[start:] for a in artifacts)
+        # Doubles hold sizes exactly up to 2**53 bytes
+        self.sizes = array('d', [a.size for a in artifacts])
+        self.mtimes = array('d', [a.mtime for a in artifacts])
+        self.mapping = mapping
+        self.seq = seq
+        self.fingerprint = fingerprint
+        self.move = move
+
+    def __len__(self):
+        return len(self.names)
+
+    def artifacts(self):
+        '''Returns the queued artifacts as a list of Artifacts.'''
+        return [Artifact(os.path.join(self.source, name), int(size), mtime)
+                for name, size, mtime in zip(self.names, self.sizes,
+                                             self.mtimes)]
+
+
+class ArtifactMapping(Mapping):
+    '''Template mapping for an album's artifacts, backed by one of its items.
+    Only the item's id is held while the album is queued; the item is loaded
+    from the library, and its formatted view including the album's fields
+    created, when a field is first looked up. Each field is formatted with
+    path separators replaced on first access. $albumpath is the album's
+    destination directory.
+    '''
+    # Fields that historically fell back to 'None' when empty
+    defaulted = ('artist', 'albumartist', 'album')
+
+    def __init__(self, item, album_path):
+        self.album_id = item.album_id
+        self.album_path = album_path
+        if item.id is None:
+            # Not in a library to be loaded back from
+            self._lib = None
+            self._item = item
+        else:
+            self._lib = item._db
+            self._item = item.id
+        self._formatted = None
+        self._values = {}
+
+    @property
+    def formatted(self):
+        if self._formatted is None:
+            if self._lib is None:
+                item = self._item
+            else:
+                item = self._lib.get_item(self._item)
+            self._formatted = item.formatted(for_path=True) if item else {}
+        return self._formatted
+
+    def unload(self):
+        '''Drops the item's formatted view, keeping the fields looked up so
+        far, until a field that hasn't been is next looked up.
+        '''
+        self._formatted = None
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+
+        if key == 'albumpath':
+            value = beets.util.displayable_path(self.album_path)
+        else:
+            value = self.formatted[key]
+            if key in self.defaulted and not value:
+                value = u'None'
+
+        self._values[key] = value
+        return value
+
+    def __iter__(self):
+        yield 'albumpath'
+        for key in self.formatted:
+            if key != 'albumpath':
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class TransferPool(object):
+    '''Runs artifact transfers on a bounded pool of worker threads. With a
+    single worker transfers are run inline in the calling thread, unless
+    inline is False.
+    '''
+    def __init__(self, workers, inline=True):
+        self.workers = max(1, workers)
+        self.inline = inline and self.workers == 1
+        self._queue = queue.Queue(maxsize=self.workers * 2)
+        self._threads = []
+        self._errors = []
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args):
+        if self.inline:
+            func(*args)
+            return
+
+        if not self._threads:
+            self._start()
+        # Blocks while the queue is full, bounding pending transfers
+        self._queue.put((func, args))
+
+    def join(self):
+        '''Wait for all submitted transfers to finish. The first error raised
+        by a worker is re-raised here.
+        '''
+        if self._threads:
+            self._queue.join()
+
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        self.join()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _start(self):
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                self._queue.task_done()
+                return
+
+            func, args = task
+            try:
+                func(*args)
+            except Exception as exc:
+                with self._lock:
+                    self._errors.append(exc)
+            finally:
+                self._queue.task_done()
+
+
+class DirectoryIndex(object):
+    '''A hashed set of walked directories. A directory is considered seen if
+    it, or any of its ancestors, has already been walked. Directories
+    walked only depth levels down cover the subdirectories within that
+    depth, so a depth of 0 is an exact match.
+    '''
+    def __init__(self):
+        self._dirs = {}
+
+    def add(self, path, depth=None):
+        self._dirs[os.path.normpath(path)] = depth
+
+    def __contains__(self, path):
+        path = os.path.normpath(path)
+        level = 0
+        while True:
+            if path in self._dirs:
+                depth = self._dirs[path]
+                if depth is None or level <= depth:
+                    return True
+            parent = os.path.dirname(path)
+            if parent == path:
+                return False
+            path = parent
+            level += 1
+
+    def __len__(self):
+        return len(self._dirs)
+
+
+class StateDatabase(object):
+    '''The SQLite database next to the library holding the digest cache and
+    the fingerprint store. Both share its one connection and lock, so that
+    writes from transfer threads never wait on a transaction held open by
+    another connection.
+    '''
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(beets.util.py3_path(path),
+                                    check_same_thread=False)
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+class DigestCache(object):
+    '''Persistent cache of artifact content digests stored in the state
+    database. Entries are keyed by path and are only used while the file's
+    size and mtime are unchanged.
+    '''
+    chunk_size = 1024 * 1024
+
+    def __init__(self, db):
+        self._lock = db.lock
+        self._conn = db.conn
+        self._conn.execute('CREATE TABLE IF NOT EXISTS digests ('
+                           'path BLOB PRIMARY KEY, size INTEGER, '
+                           'mtime REAL, digest TEXT)')
+
+    def digest(self, path, size, mtime):
+        '''Returns the digest of the file at path, hashing it only if there
+        is no cached digest matching its current size and mtime.
+        '''
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT size, mtime, digest FROM digests WHERE path = ?',
+                (sqlite3.Binary(path),)).fetchone()
+        if row and row[0] == size and row[1] == mtime:
+            return row[2]
+
+        digest = self._hash(path)
+        self._put(path, size, mtime, digest)
+        return digest
+
+    def store(self, path, digest):
+        '''Records the digest of a file that has just been written.'''
+        stat = os.stat(path)
+        self._put(path, stat.st_size, stat.st_mtime, digest)
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def _put(self, path, size, mtime, digest):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)',
+                (sqlite3.Binary(path), size, mtime, digest))
+
+    def _hash(self, path):
+        sha = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+
+class FingerprintStore(object):
+    '''Fingerprints of the album directories whose artifacts have been
+    processed, stored in the state database alongside the digest cache.
+    '''
+    def __init__(self, db):
+        self._lock = db.lock
+        self._conn = db.conn
+        self._conn.execute('CREATE TABLE IF NOT EXISTS fingerprints ('
+                           'path BLOB PRIMARY KEY, fingerprint TEXT)')
+
+    def get(self, path):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT fingerprint FROM fingerprints WHERE path = ?',
+                (sqlite3.Binary(path),)).fetchone()
+        return row[0] if row else None
+
+    def store(self, path, fingerprint):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO fingerprints VALUES (?, ?)',
+                (sqlite3.Binary(path), fingerprint))
+            self._conn.commit()
+
+
+class ArtifactIndex(object):
+    '''Artifacts recorded against the albums they belong to, kept in a
+    table of the beets library database. Paths are those of the artifacts
+    at their destinations.
+    '''
+    def __init__(self, lib):
+        self.lib = lib
+        with lib.transaction() as tx:
+            tx.script('CREATE TABLE IF NOT EXISTS copyartifacts ('
+                      'album_id INTEGER, path BLOB, size INTEGER, '
+                      'mtime REAL, digest TEXT, '
+                      'PRIMARY KEY (album_id, path))')
+
+    def artifacts(self, album_id, directory):
+        '''Returns the artifacts of an album recorded in directory or its
+        subdirectories.
+        '''
+        prefix = os.path.join(directory, b'')
+        # Paths starting with the prefix sort between it and the prefix
+        # with its trailing separator incremented
+        end = prefix[:-1] + six.int2byte(six.indexbytes(prefix, -1) + 1)
+        with self.lib.transaction() as tx:
+            rows = tx.query(
+                'SELECT path, size, mtime FROM copyartifacts '
+                'WHERE album_id = ? AND path >= ? AND path < ? '
+                'ORDER BY path',
+                (album_id, sqlite3.Binary(prefix), sqlite3.Binary(end)))
+        return [Artifact(bytes(path), size, mtime)
+                for path, size, mtime in rows]
+
+    def update(self, album_id, removed, added):
+        '''Forgets the artifacts at the paths in removed and records those
+        in added, a list of (path, size, mtime, digest) tuples.
+        '''
+        with self.lib.transaction() as tx:
+            for path in removed:
+                tx.mutate('DELETE FROM copyartifacts '
+                          'WHERE album_id = ? AND path = ?',
+                          (album_id, sqlite3.Binary(path)))
+            for path, size, mtime, digest in added:
+                tx.mutate('INSERT OR REPLACE INTO copyartifacts '
+                          'VALUES (?, ?, ?, ?, ?)',
+                          (album_id, sqlite3.Binary(path), size, mtime,
+                           digest))
+
+
+class Journal(object):
+    '''Append-only journal of queued artifact work. Each album's work is
+    recorded when it is queued, when processing starts and when it is
+    done, so that work left unfinished by an interrupted run can be
+    replayed by the next one. Records are pickled one after another, as
+    with beets' own state file. Each queued record notes whether the
+    album's artifacts are moved, so that they are replayed the same way.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._unfinished = set()
+
+        pending = self._read_pending()
+        # Rewrite the journal with only the unfinished work. The new journal
+        # replaces the old one only once it is complete and on disk, so a
+        # crash meanwhile leaves the old one to be read again
+        tmp_path = path + b'.tmp'
+        self._file = open(tmp_path, 'wb')
+        self.pending = []
+        for record in pending:
+            self.pending.append(self.queued(*record[2:]))
+        os.fsync(self._file.fileno())
+        self._file.close()
+        # os.rename replaces atomically on POSIX where os.replace is missing
+        getattr(os, 'replace', os.rename)(tmp_path, path)
+        self._file = open(path, 'ab')
+
+    def _read_pending(self):
+        records = {}
+        try:
+            with open(self.path, 'rb') as f:
+                while True:
+                    record = pickle.load(f)
+                    if record[0] == 'queued':
+                        if len(record) == 6:
+                            # Recorded before the move flag was
+                            record += (False,)
+                        records[record[1]] = record
+                    elif record[0] == 'done':
+                        records.pop(record[1], None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            # No journal, or the end of one, possibly cut short by a crash
+            pass
+        return [records[seq] for seq in sorted(records)]
+
+    def _write(self, record):
+        with self._lock:
+            pickle.dump(record, self._file, protocol=2)
+            self._file.flush()
+
+    def queued(self, item_id, source_path, dest_path, files, move=False):
+        '''Records an album's work as planned and returns the record, whose
+        second element is its sequence number.
+        '''
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self._unfinished.add(seq)
+        record = ('queued', seq, item_id, source_path, dest_path, files, move)
+        self._write(record)
+        return record
+
+    def started(self, seq):
+        self._write(('started', seq))
+
+    def done(self, seq):
+        with self._lock:
+            self._unfinished.discard(seq)
+        self._write(('done', seq))
+
+    def close(self):
+        '''Closes the journal, removing it if all the work recorded in it,
+        including any replayed from an earlier run, is finished.
+        '''
+        self._file.close()
+        if not self._unfinished:
+            os.remove(self.path)
+
+
+class Stats(object):
+    '''Counters and cumulative stage durations for a run of the plugin.
+    Durations of stages run by worker threads are summed across workers.
+    '''
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.durations = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    @contextmanager
+    def timed(self, stage):
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                self.durations[stage] += elapsed
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'durations': dict(self.durations),
+            }
+
+
 class CopyArtifactsPlugin(BeetsPlugin):
     def __init__(self):
         super(CopyArtifactsPlugin, self).__init__()
 
         self.config.add({
             'extensions': '.*',
-            'print_ignored': False
+            'print_ignored': False,
+            'streaming': False,
+            'workers': 1,
+            'digest_cache': False,
+            'transfer': 'copy',
+            'stats_file': '',
+            'batch_size': 100,
+            'journal': False,
+            'backend': 'sync',
+            'concurrency': 16,
+            'fsync': False,
+            'max_depth': None,
+            'max_files': None,
+            'max_entries': None,
+            'max_bytes': None,
+            'buffer_size': 1024 * 1024,
+            'preallocate': False,
+            'skip_unchanged': False,
+            'index': False,
+            'bytes_per_second': None,
+            'files_per_second': None,
+            'idle_priority': False,
         })
 
-        self._process_queue = []
-        self._dirs_seen = []
+        self._process_queue = deque()
+        self._dirs_seen = DirectoryIndex()
+        self._mappings = {}
+        # Events can be delivered from any of the import pipeline's threads.
+        # Collecting an album, from checking its directory hasn't been seen
+        # to queueing its artifacts, happens under one lock, and queued
+        # albums are processed by one thread at a time
+        self._collect_lock = threading.RLock()
+        self._process_lock = threading.Lock()
 
         self.extensions = self.config['extensions'].as_str_seq()
+        self._matcher = ArtifactMatcher(self.extensions)
         self.print_ignored = self.config['print_ignored'].get()
+        self.streaming = self.config['streaming'].get(bool)
+        self.transfer = self.config['transfer'].as_choice(
+            ['copy', 'reflink', 'hardlink', 'symlink'])
+        self.backend = self.config['backend'].as_choice(['sync', 'asyncio'])
+        self.concurrency = max(1, self.config['concurrency'].get(int))
+        self.fsync = self.config['fsync'].get(bool)
+        self.max_depth = self.config['max_depth'].get()
+        self.max_files = self.config['max_files'].get()
+        self.max_entries = self.config['max_entries'].get()
+        self.max_bytes = self.config['max_bytes'].get()
+        self.buffer_size = self.config['buffer_size'].get(int)
+        self.preallocate = self.config['preallocate'].get(bool)
+        self._throttle = Throttle(self.config['bytes_per_second'].get(),
+                                  self.config['files_per_second'].get())
+        self.idle_priority = self.config['idle_priority'].get(bool)
+        # Threads whose priority has been lowered mark it here
+        self._thread_state = threading.local()
+        if self.backend == 'asyncio' and asyncio is None:
+            self._log.warning(u'asyncio is not available, using the '
+                              u'sync backend')
+            self.backend = 'sync'
+        # Transfers at idle priority are kept off the calling thread, which
+        # is beets' own, as its priority can't be raised again
+        self._pool = TransferPool(self.config['workers'].get(int),
+                                  inline=not self.idle_priority)
+        self._stats = Stats()
+        self._pretend = False
+        self._prune_dirs = set()
+        self._destinations = DestinationCache()
+        self._devices = {}
+        self._moved_sources = []
+
+        self._state = None
+        self._digests = None
+        self._fingerprints = None
+        if (self.config['digest_cache'].get(bool) or
+                self.config['skip_unchanged'].get(bool)):
+            self._state = StateDatabase(self._state_path('copyartifacts.db'))
+        if self.config['digest_cache'].get(bool):
+            self._digests = DigestCache(self._state)
+        if self.config['skip_unchanged'].get(bool):
+            self._fingerprints = FingerprintStore(self._state)
 
-        self.path_formats = [c for c in beets.ui.get_path_formats() if c[0][:4] == u'ext:']
+        # Opened against the library when it's first needed
+        self._index = None
+        self._importing = False
 
-        self.register_listener('item_moved', self.collect_artifacts)
+        # Only opened, and any unfinished work replayed, by commands that
+        # transfer artifacts, so that other commands leave it untouched
+        self._journal = None
+        # Whether albums are being synced by the artifacts command, which
+        # always moves them
+        self._syncing = False
+
+        # Compile the ext: path formats once, keyed by file extension. The
+        # first format for an extension wins, as with beets' own path formats
+        self.path_formats = {}
+        for query, path_format in beets.ui.get_path_formats():
+            if query[:4] != u'ext:':
+                continue
+            if not isinstance(path_format, Template):
+                path_format = Template(path_format)
+            self.path_formats.setdefault(u'.' + query[4:], path_format)
+        self._template_funcs = DefaultTemplateFunctions().functions()
+
+        self.register_listener('item_moved', self.relocate_artifacts)
         self.register_listener('item_copied', self.collect_artifacts)
+        self.register_listener('import_begin', self.import_begin)
+        self.register_listener('import_task_files', self.process_task)
         self.register_listener('cli_exit', self.process_events)
 
+    def _state_path(self, name):
+        '''Returns the path of a file the plugin keeps next to the beets
+        library database.
+        '''
+        library = config['library'].as_filename()
+        return beets.util.bytestring_path(
+            os.path.join(os.path.dirname(library), name))
+
+    def commands(self):
+        cmd = ui.Subcommand('artifacts',
+                            help=u'sync artifacts for albums in the library')
+        cmd.parser.add_option(
+            u'-p', u'--pretend', action='store_true', default=False,
+            help=u'show how artifacts would be moved without moving them')
+        cmd.parser.add_option(
+            u'-w', u'--workers', type='int', default=None,
+            help=u'number of worker threads to move artifacts with')
+        cmd.parser.add_option(
+            u'-b', u'--batch-size', type='int', default=None,
+            help=u'number of albums to walk before moving their artifacts')
+        cmd.func = self.sync_artifacts
+        return [cmd]
+
+    def sync_artifacts(self, lib, opts, args):
+        '''Moves the artifacts next to each matched album's items to their
+        destinations according to the ext: path formats, without going
+        through the importer.
+        '''
+        self._pretend = opts.pretend
+        self._syncing = True
+        self._artifact_index(lib)
+        if not self._pretend:
+            self.replay_journal(lib)
+        if opts.workers:
+            self._pool = TransferPool(opts.workers,
+                                      inline=not self.idle_priority)
+        batch_size = opts.batch_size or self.config['batch_size'].get(int)
+
+        for album in lib.albums(ui.decargs(args)):
+            for item in album.items():
+                # The artifacts stay beside the items, only ext: path
+                # formats cause them to be renamed
+                self.collect_artifacts(item, item.path, item.path)
+
+            if len(self._process_queue) >= batch_size:
+                self._process_batch()
+
+        self._process_batch()
+
+    def _process_batch(self):
+        '''Processes a batch of synced albums, then forgets the destination
+        listings and devices seen, so that memory use is bounded by the
+        batch rather than the library.
+        '''
+        self._process_queued(reimport=True)
+        self._destinations.clear()
+        self._devices.clear()
+
+    def _artifact_index(self, lib):
+        if self._index is None and self.config['index'].get(bool):
+            self._index = ArtifactIndex(lib)
+        return self._index
+
     def _destination(self, filename, mapping):
         '''Returns a destination path a file should be moved to. The filename
         is unique to ensure files aren't overwritten. This also checks the
@@ -42,26 +1178,17 @@ class CopyArtifactsPlugin(BeetsPlugin):
         extension the original filename is used with the album path.
             - ripped from beets/library.py
         '''
-        file_ext = os.path.splitext(filename)[1]
+        file_ext = os.path.splitext(filename)[1].decode('utf8')
 
-        for query, path_format in self.path_formats:
-            query_ext = '.' + query[4:]
-            if query_ext == file_ext.decode('utf8'):
-                break
-        else:
+        subpath_tmpl = self.path_formats.get(file_ext)
+        if subpath_tmpl is None:
             # No query matched; use original filename
             file_path = os.path.join(mapping['albumpath'],
                                      beets.util.displayable_path(filename))
             return file_path
 
-        if isinstance(path_format, Template):
-            subpath_tmpl = path_format
-        else:
-            subpath_tmpl = Template(path_format)
-
-        # Get template funcs and evaluate against mapping
-        funcs = DefaultTemplateFunctions().functions()
-        file_path = subpath_tmpl.substitute(mapping, funcs) + file_ext.decode('utf8')
+        # Evaluate template funcs against mapping
+        file_path = subpath_tmpl.substitute(mapping, self._template_funcs) + file_ext
 
         # Sanitize filename
         filename = beets.util.sanitize_path(os.path.basename(file_path))
@@ -70,130 +1197,704 @@ class CopyArtifactsPlugin(BeetsPlugin):
 
         return file_path
 
-    # XXX: may be better to use FormattedMapping class from beets/dbcore/db.py
-    def _get_formatted(self, value):
-        '''Replace path separators in value
-            - ripped from beets/dbcore/db.py
-        '''
-        sep_repl = beets.config['path_sep_replace'].as_str()
-        for sep in (os.path.sep, os.path.altsep):
-            if sep:
-                value = value.replace(sep, sep_repl)
-
-        return value
-
     def _generate_mapping(self, item, album_path):
-        mapping = {
-            'artist': item.artist or u'None',
-            'albumartist': item.albumartist or u'None',
-            'album': item.album or u'None',
-        }
-        for key in mapping:
-            mapping[key] = self._get_formatted(mapping[key])
-
-        mapping['albumpath'] = beets.util.displayable_path(album_path)
-
+        # The items of an album spread over several source directories share
+        # one mapping until the queue is next drained
+        if not item.album_id:
+            return ArtifactMapping(item, album_path)
+        key = (item.album_id, album_path)
+        mapping = self._mappings.get(key)
+        if mapping is None:
+            mapping = self._mappings[key] = ArtifactMapping(item, album_path)
         return mapping
 
     def collect_artifacts(self, item, source, destination):
+        with self._collect_lock:
+            self._collect_artifacts(item, source, destination)
+
+    def _collect_artifacts(self, item, source, destination):
         source_path = os.path.dirname(source)
         dest_path = os.path.dirname(destination)
 
-        # Check if this path has already been processed
+        # Check if this path, or a parent of it, has already been processed
         if source_path in self._dirs_seen:
             return
 
-        non_handled_files = []
-        for root, dirs, files in beets.util.sorted_walk(
-                    source_path, ignore=config['ignore'].as_str_seq()):
-            for filename in files:
-                source_file = os.path.join(root, filename)
+        mapping = self._generate_mapping(item, dest_path)
+        fingerprint = None
+        if self._fingerprints:
+            fingerprint = (source_path, dest_path,
+                           self._destination_signature(mapping))
+            mapping.unload()
+            if self._unchanged(*fingerprint):
+                self._log.debug(u'Skipping unchanged artifacts of {0}',
+                                beets.util.displayable_path(source_path))
+                self._stats.count('skipped.unchanged')
+                self._dirs_seen.add(source_path, self.max_depth)
+                return
+
+        try:
+            non_handled_files = self._walk(source_path)
+        except ScanLimitExceeded as exc:
+            self._log.warning(u'Skipping artifacts of {0}: {1}',
+                              beets.util.displayable_path(source_path), exc)
+            self._stats.count('skipped.limit')
+            # Albums in its subdirectories are still walked for themselves
+            self._dirs_seen.add(source_path, 0)
+            return
+        self._dirs_seen.add(source_path, self.max_depth)
+        if not non_handled_files:
+            self._store_fingerprint(fingerprint)
+            return
+
+        move = self._syncing or config['import']['move'].get(bool)
+        seq = None
+        if self._journal:
+            seq = self._journal.queued(item.id, source_path, dest_path,
+                                       non_handled_files, move)[1]
+
+        self._process_queue.append(QueuedAlbum(
+            source_path, non_handled_files, mapping, seq, fingerprint, move))
+
+    def relocate_artifacts(self, item, source, destination):
+        '''Moves the indexed artifacts of an album that has been moved
+        outside the importer, such as by ``beet move`` or ``beet modify``,
+        without walking its directory. Albums that aren't in the index, and
+        moves made while importing, are collected as usual.
+        '''
+        with self._collect_lock:
+            self._relocate_artifacts(item, source, destination)
+
+    def _relocate_artifacts(self, item, source, destination):
+        index = self._artifact_index(item._db)
+        if index is None or self._importing or not item.album_id:
+            self.collect_artifacts(item, source, destination)
+            return
+
+        source_path = os.path.dirname(source)
+        dest_path = os.path.dirname(destination)
+        if source_path in self._dirs_seen:
+            return
+
+        artifacts = index.artifacts(item.album_id, source_path)
+        if not artifacts:
+            self.collect_artifacts(item, source, destination)
+            return
+
+        self._dirs_seen.add(source_path)
+        self._stats.count('relocated', len(artifacts))
+        self._process_queue.append(QueuedAlbum(
+            source_path, artifacts, self._generate_mapping(item, dest_path),
+            move=True))
 
+    def _record_album(self, mapping, planned, plan):
+        '''Updates the index with where an album's artifacts now are.'''
+        album_id = mapping.album_id
+        if self._index is None or self._pretend or not album_id:
+            return
+
+        digests = dict((t.dest, t.digest) for t in plan)
+        removed = [artifact.path for artifact, _ in planned
+                   if not os.path.exists(artifact.path)]
+        added = []
+        for dest_file in sorted(set(d for _, d in planned) | set(digests)):
+            try:
+                stat = os.stat(beets.util.syspath(dest_file))
+            except OSError:
+                continue
+            added.append((dest_file, stat.st_size, stat.st_mtime,
+                          digests.get(dest_file)))
+        self._index.update(album_id, removed, added)
+
+    def _destination_signature(self, mapping):
+        '''Returns the strings that decide where an album's artifacts go:
+        the album's directory, the handled extensions and each ext: path
+        format evaluated for the album.
+        '''
+        signature = [mapping['albumpath']] + list(self.extensions)
+        for ext in sorted(self.path_formats):
+            signature.append(ext + u'=' + self.path_formats[ext].substitute(
+                mapping, self._template_funcs))
+        return signature
+
+    def _fingerprint(self, source_path, dest_path, signature):
+        '''Returns the fingerprint of an album's source directory together
+        with its destination directory, so that artifacts removed from the
+        destination are noticed, or None if either can't be read.
+        '''
+        ignore = config['ignore'].as_str_seq()
+        with self._stats.timed('fingerprint'):
+            source = directory_fingerprint(source_path, ignore, signature)
+            if source is None or dest_path == source_path:
+                return source
+            dest = directory_fingerprint(dest_path, ignore)
+            if dest is None:
+                return None
+            return source + dest
+
+    def _unchanged(self, source_path, dest_path, signature):
+        '''Whether a directory's artifacts were processed by an earlier run
+        and neither the directory, the destination directory nor where the
+        artifacts go have changed since.
+        '''
+        stored = self._fingerprints.get(source_path)
+        if stored is None:
+            return False
+        return stored == self._fingerprint(source_path, dest_path, signature)
+
+    def _store_fingerprint(self, fingerprint):
+        '''Records the fingerprint of a directory once its artifacts have
+        been processed.
+        '''
+        if fingerprint is None or self._pretend:
+            return
+        current = self._fingerprint(*fingerprint)
+        if current is not None:
+            self._fingerprints.store(fingerprint[0], current)
+
+    def _walk(self, source_path):
+        '''Returns the artifacts in an album's source directory, raising
+        ScanLimitExceeded if it holds more files or bytes than allowed.
+        '''
+        # Subdirectories already walked for another album are skipped
+        non_handled_files = []
+        total_bytes = 0
+        with self._stats.timed('walk'):
+            for artifact in scan_artifacts(
+                    source_path, ignore=config['ignore'].as_str_seq(),
+                    skip_dir=self._dirs_seen.__contains__,
+                    max_depth=self.max_depth, max_entries=self.max_entries):
                 # Skip any files extensions handled by beets
-                file_ext = os.path.splitext(filename)[1]
-                if len(file_ext) > 1 and file_ext.decode('utf8')[1:] in TYPES:
+                if os.path.splitext(artifact.path)[1] in MEDIA_EXTENSIONS:
                     continue
 
-                non_handled_files.append(source_file)
+                non_handled_files.append(artifact)
+                total_bytes += artifact.size
+                if (self.max_files is not None
+                        and len(non_handled_files) > self.max_files):
+                    raise ScanLimitExceeded(
+                        u'more than {0} files'.format(self.max_files))
+                if self.max_bytes is not None and total_bytes > self.max_bytes:
+                    raise ScanLimitExceeded(
+                        u'more than {0} bytes'.format(self.max_bytes))
 
-        self._process_queue.extend([{
-            'files': non_handled_files,
-            'mapping': self._generate_mapping(item, dest_path)
-        }])
-        self._dirs_seen.extend([source_path])
+        self._stats.count('walked', len(non_handled_files))
+        return non_handled_files
+
+    def import_begin(self, session):
+        self._importing = True
+        self._artifact_index(session.lib)
+        self.replay_journal(session.lib)
+
+    def replay_journal(self, lib):
+        '''Opens the journal and processes the artifacts left unfinished by
+        an interrupted run, as recorded in it, without walking their
+        directories again.
+        '''
+        if not self.config['journal'].get(bool) or self._journal:
+            return
+        self._journal = Journal(self._state_path('copyartifacts.journal'))
+        if not self._journal.pending:
+            return
+
+        self._log.info(u'Resuming {0} unfinished albums from journal',
+                       len(self._journal.pending))
+        with self._collect_lock:
+            for _, seq, item_id, source_path, dest_path, files, move in \
+                    self._journal.pending:
+                item = lib.get_item(item_id)
+                if item is None:
+                    self._journal.done(seq)
+                    continue
+
+                self._process_queue.append(QueuedAlbum(
+                    source_path, files,
+                    self._generate_mapping(item, dest_path), seq, move=move))
+                self._dirs_seen.add(source_path, self.max_depth)
+            self._journal.pending = []
+
+        self._process_queued()
+
+    def process_task(self, session, task):
+        '''In streaming mode, transfer the artifacts collected for a task as
+        soon as beets has finished moving or copying its items, rather than
+        holding them until cli_exit.
+        '''
+        if self.streaming:
+            self._process_queued()
 
     def process_events(self):
-        for item in self._process_queue:
-            self.process_artifacts(item['files'], item['mapping'], False)
+        self._process_queued()
+        self._pool.close()
+        self._destinations.clear()
+        self._devices.clear()
+        if self._state:
+            self._state.close()
+        if self._journal:
+            self._journal.close()
+        self._report_stats()
+
+    def _report_stats(self):
+        stats = self._stats.as_dict()
+        counters = stats['counters']
+        if counters:
+            self._log.info(u'Transferred {0} artifacts ({1} bytes) of {2} found',
+                           counters.get('files', 0), counters.get('bytes', 0),
+                           counters.get('walked', 0))
+            for name in sorted(counters):
+                if name.startswith('skipped.'):
+                    self._log.info(u'Skipped {0} artifacts: {1}',
+                                   counters[name], name[8:])
+            for stage in sorted(stats['durations']):
+                self._log.info(u'Time spent in {0}: {1:.3f}s',
+                               stage, stats['durations'][stage])
+
+        # Commands that didn't touch any artifacts, such as 'beet ls', leave
+        # the last import's statistics in place
+        if not counters and not stats['durations']:
+            return
+        if self.config['stats_file'].get():
+            with open(self.config['stats_file'].as_filename(), 'w') as f:
+                json.dump(stats, f, indent=2, sort_keys=True)
 
-    def process_artifacts(self, source_files, mapping, reimport=False):
+    def _process_queued(self, reimport=False):
+        with self._process_lock:
+            if self.backend == 'asyncio':
+                self._process_queued_async(reimport)
+            else:
+                self._process_queued_sync(reimport)
+
+    def _process_queued_sync(self, reimport):
+        # Entries are dropped as they are processed so the queue only ever
+        # holds albums that are still in flight. Albums queued by another
+        # thread meanwhile are picked up too
+        while True:
+            try:
+                album = self._process_queue.popleft()
+            except IndexError:
+                break
+            if album.seq is not None:
+                self._journal.started(album.seq)
+            self.process_artifacts(album.artifacts(), album.mapping,
+                                   reimport or album.move, album.source)
+            self._store_fingerprint(album.fingerprint)
+            if album.seq is not None:
+                self._journal.done(album.seq)
+        self._mappings.clear()
+
+    def process_artifacts(self, source_files, mapping, reimport=False,
+                          source_path=None):
         if len(source_files) == 0:
             return
 
         ignored_files = []
-        source_path = os.path.dirname(source_files[0])
+        move = config['import']['move'] or reimport
 
-        for source_file in source_files:
-            # os.path.basename() not suitable here as files may be contained
-            # within dir of source_path
-            filename = source_file[len(source_path)+1:]
+        # Plan every transfer of the album before making any of them
+        planned = []
+        for artifact, dest_file in self._plan_destinations(
+                source_files, mapping, source_path):
+            if dest_file is None:
+                ignored_files.append(artifact.path)
+            else:
+                planned.append((artifact, dest_file))
+        checked = [self._check_artifact(artifact, dest_file)
+                   for artifact, dest_file in planned]
+        plan = self._resolve_plan(planned, checked, ignored_files)
 
-            dest_file = self._destination(filename, mapping)
+        if self._pretend:
+            self.print_plan(plan)
+        else:
+            for transfer in plan:
+                self._log_transfer(transfer, move)
+                self._pool.submit(self._transfer_artifact, transfer, move)
 
-            # Skip as another plugin or beets has already moved this file
-            if not os.path.exists(source_file):
-                ignored_files.append(source_file)
-                continue
+        self._pool.join()
+        self._finish_album(ignored_files)
+        self._record_album(mapping, planned, plan)
+        self._prune_source_dirs()
+
+    def _plan_destinations(self, source_files, mapping, source_path=None):
+        '''Yields each artifact with its destination, or None where the
+        file's extension isn't handled by the plugin. Artifacts are named
+        relative to source_path, by default the first artifact's directory.
+        '''
+        if source_path is None:
+            source_path = os.path.dirname(source_files[0].path)
+
+        for artifact in source_files:
+            # os.path.basename() not suitable here as files may be contained
+            # within dir of source_path
+            filename = artifact.path[len(source_path)+1:]
 
             # Skip extensions not handled by plugin
-            file_ext = os.path.splitext(filename)[1]
-            if ('.*' not in self.extensions
-                and file_ext.decode('utf8') not in self.extensions):
-                ignored_files.append(source_file)
+            if not self._matcher(filename):
+                self._stats.count('skipped.extension')
+                yield artifact, None
                 continue
 
-            # Skip file if it already exists in dest
-            if (os.path.exists(dest_file)
-                and filecmp.cmp(source_file, dest_file)):
-                ignored_files.append(source_file)
+            with self._stats.timed('destination'):
+                dest_file = beets.util.bytestring_path(
+                    self._destination(filename, mapping))
+            yield artifact, dest_file
+
+    def _check_artifact(self, artifact, dest_file):
+        '''Checks whether an artifact should be transferred. Returns
+        whether it is skipped and the source digest if one was computed.
+        '''
+        # Skip as another plugin or beets has already moved this file
+        if not os.path.exists(artifact.path):
+            self._stats.count('skipped.missing')
+            return True, None
+
+        # Skip file if it already exists in dest. The destination directory
+        # listing is cached, so only existing destinations are stat'd to be
+        # compared against the size and mtime captured during the scan
+        if not self._destinations.exists(dest_file):
+            return False, None
+        try:
+            dest_stat = os.stat(dest_file)
+        except OSError:
+            return False, None
+
+        with self._stats.timed('compare'):
+            same, digest = self._compare(artifact, dest_file, dest_stat)
+        if same:
+            self._stats.count('skipped.duplicate')
+        return same, digest
+
+    def _resolve_plan(self, planned, checked, ignored_files):
+        '''Returns the transfers for an album's planned artifacts, given the
+        result of checking each one. Artifacts that are skipped are added to
+        ignored_files. Name collisions, with existing files or between the
+        album's own artifacts, are resolved in memory against the cached
+        listing of each destination directory, in album order.
+        '''
+        plan = []
+        for (artifact, dest_file), (skipped, digest) in zip(planned, checked):
+            if skipped:
+                ignored_files.append(artifact.path)
+                continue
+            if _is_numbered_form(artifact.path, dest_file):
+                # Already renamed by an earlier run, renaming it again
+                # would only count it up past its own name
+                self._stats.count('skipped.in_place')
                 continue
+            plan.append(Transfer(artifact, self._destinations.claim(dest_file),
+                                 digest))
+        return plan
 
-            dest_file = beets.util.unique_path(dest_file)
-            beets.util.mkdirall(dest_file)
-            dest_file = beets.util.bytestring_path(dest_file)
+    def print_plan(self, plan):
+        for transfer in plan:
+            ui.print_(u'{0} -> {1}'.format(
+                beets.util.displayable_path(transfer.artifact.path),
+                beets.util.displayable_path(transfer.dest)))
 
-            # TODO: detect if beets was called with 'move' and override config
-            # option here
+    def _log_transfer(self, transfer, move):
+        # TODO: detect if beets was called with 'move' and override config
+        # option here
 
-            if config['import']['move']:
-                self._move_artifact(source_file, dest_file)
-            else:
-                if reimport:
-                    # This is a reimport
-                    # files are already in the library directory
-                    self._move_artifact(source_file, dest_file)
-                else:
-                    # A normal import, just copy
-                    self._copy_artifact(source_file, dest_file)
+        self._stats.count('files')
+        self._stats.count('bytes', transfer.artifact.size)
 
+        # Logged before submitting so output stays in album order
+        dest_name = os.path.basename(transfer.dest.decode('utf8'))
+        if move:
+            # A move, or a reimport where files are already in the
+            # library directory
+            self._log.info(u'Moving artifact: {0}'.format(dest_name))
+        elif self.transfer == 'copy':
+            # A normal import, just copy
+            self._log.info(u'Copying artifact: {0}'.format(dest_name))
+        else:
+            self._log.info(u'Linking artifact: {0}'.format(dest_name))
+
+    def _transfer_artifact(self, transfer, move):
+        artifact, dest_file, digest = transfer
+        if self.idle_priority:
+            self._lower_priority()
+        if self._throttle:
+            with self._stats.timed('throttle'):
+                self._throttle.consume(files=1)
+        self._destinations.makedirs(dest_file)
+        if move:
+            self._move_artifact(artifact.path, dest_file, digest)
+            self._destinations.release(artifact.path)
+        else:
+            self._copy_artifact(artifact.path, dest_file, digest)
+
+    def _finish_album(self, ignored_files):
+        if self._digests:
+            self._digests.commit()
+        self._delete_moved_sources()
 
         if self.print_ignored and ignored_files:
             self._log.warning(u'Ignored files:')
             for f in ignored_files:
                 self._log.warning('   {0}', os.path.basename(f))
 
-    def _copy_artifact(self, source_file, dest_file):
-        self._log.info(u'Copying artifact: {0}'.format(os.path.basename(dest_file.decode('utf8'))))
-        beets.util.copy(source_file, dest_file)
+    def _process_queued_async(self, reimport):
+        '''Processes all queued albums on an asyncio event loop. Existence
+        checks and comparisons, then directory creation and transfers, are
+        run on an executor limited to `concurrency` blocking calls at a
+        time, pipelined across files and albums. Destinations are resolved
+        on the loop thread, in album order, once an album's checks are done.
+        '''
+        entries = []
+        while True:
+            try:
+                entries.append(self._process_queue.popleft())
+            except IndexError:
+                break
+        if not entries:
+            return
+
+        loop = asyncio.new_event_loop()
+        executor = futures.ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            albums = []
+            for album in entries:
+                if album.seq is not None:
+                    self._journal.started(album.seq)
+                albums.append(self._process_album_async(
+                    loop, executor, album, reimport))
+            loop.run_until_complete(asyncio.gather(*albums))
+        finally:
+            executor.shutdown()
+            loop.close()
+        self._mappings.clear()
+
+        self._prune_source_dirs()
+
+    def _process_album_async(self, loop, executor, album, reimport):
+        '''Schedules the work for one album, returning a future that is
+        done once all of its artifacts have been transferred.
+        '''
+        done = loop.create_future()
+        ignored_files = []
+        move = config['import']['move'] or reimport or album.move
+
+        planned = []
+        checks = []
+        plan = []
+        if len(album):
+            for artifact, dest_file in self._plan_destinations(
+                    album.artifacts(), album.mapping, album.source):
+                if dest_file is None:
+                    ignored_files.append(artifact.path)
+                    continue
+                planned.append((artifact, dest_file))
+                checks.append(loop.run_in_executor(
+                    executor, self._check_artifact, artifact, dest_file))
+
+        def finished(transfers):
+            try:
+                transfers.result()
+                self._finish_album(ignored_files)
+                self._record_album(album.mapping, planned, plan)
+                self._store_fingerprint(album.fingerprint)
+                if album.seq is not None:
+                    self._journal.done(album.seq)
+            except Exception as exc:
+                done.set_exception(exc)
+            else:
+                done.set_result(None)
+
+        def resolve(checked):
+            try:
+                plan.extend(self._resolve_plan(planned, checked.result(),
+                                               ignored_files))
+                transfers = []
+                if self._pretend:
+                    self.print_plan(plan)
+                    del plan[:]
+                for transfer in plan:
+                    self._log_transfer(transfer, move)
+                    transfers.append(loop.run_in_executor(
+                        executor, self._transfer_artifact, transfer, move))
+            except Exception as exc:
+                done.set_exception(exc)
+                return
+            _gather(loop, transfers).add_done_callback(finished)
+
+        _gather(loop, checks).add_done_callback(resolve)
+        return done
+
+    def _compare(self, artifact, dest_file, dest_stat):
+        '''Compares an artifact with an existing destination file, first by
+        size and mtime, then by cached digest or file contents. Returns
+        whether they are identical along with the source digest, if it was
+        needed.
+        '''
+        if artifact.size != dest_stat.st_size:
+            return False, None
+        if artifact.mtime == dest_stat.st_mtime:
+            # Same signature, as filecmp.cmp's shallow check
+            return True, None
+
+        if self._digests is None:
+            return filecmp.cmp(artifact.path, dest_file, shallow=False), None
+
+        digest = self._digests.digest(artifact.path, artifact.size,
+                                      artifact.mtime)
+        return digest == self._digests.digest(dest_file, dest_stat.st_size,
+                                              dest_stat.st_mtime), digest
+
+    def _copy_artifact(self, source_file, dest_file, digest=None):
+        with self._stats.timed(self.transfer):
+            if self.transfer != 'copy':
+                try:
+                    self._link_artifact(source_file, dest_file)
+                    return
+                except (OSError, IOError) as exc:
+                    # Most likely a link across filesystems or a filesystem
+                    # without reflink support, fall back to a plain copy
+                    self._log.debug(u'Could not {0} artifact, copying: {1}',
+                                    self.transfer, exc)
+                    self._stats.count('fallback.copy')
+
+            self._copy(source_file, dest_file)
+        if digest and self._digests:
+            self._digests.store(dest_file, digest)
 
-    def _move_artifact(self, source_file, dest_file):
-        if not os.path.exists(source_file):
-            # Sanity check for other plugins moving files
+    def _lower_priority(self):
+        '''Runs the calling thread, one of the transfer pool's or the
+        asyncio backend's workers, at idle priority, once per thread.
+        '''
+        if getattr(self._thread_state, 'idle', False):
             return
+        self._thread_state.idle = True
+        if not idle_priority():
+            self._log.debug(u'Could not set idle I/O priority')
+
+    def _copy(self, source_file, dest_file):
+        mechanism = fast_copy(source_file, dest_file, self.buffer_size,
+                              self.preallocate, self._throttle or None)
+        self._stats.count('copied.' + mechanism)
+        self._log.debug(u'Copied {0} using {1}',
+                        beets.util.displayable_path(dest_file), mechanism)
+
+    def _link_artifact(self, source_file, dest_file):
+        source_file = beets.util.syspath(source_file)
+        dest_file = beets.util.syspath(dest_file)
+        if self.transfer == 'reflink':
+            reflink(source_file, dest_file)
+        elif self.transfer == 'hardlink':
+            os.link(source_file, dest_file)
+        else:
+            os.symlink(source_file, dest_file)
+
+    def _device(self, directory):
+        '''Returns the device of a directory, stat'ing each directory once.'''
+        try:
+            return self._devices[directory]
+        except KeyError:
+            device = os.stat(beets.util.syspath(directory)).st_dev
+            self._devices[directory] = device
+            return device
 
-        self._log.info(u'Moving artifact: {0}'.format(os.path.basename(dest_file.decode('utf8'))))
-        beets.util.move(source_file, dest_file)
+    def _rename(self, source_file, dest_file):
+        '''Renames an artifact without replacing an existing destination,
+        by linking it to its new name and unlinking the old one. On
+        filesystems without hard links, such as vfat or many CIFS mounts,
+        it is renamed once the destination, already claimed in the
+        destination cache, is confirmed to still be free. Returns False if
+        the filesystem can't rename it at all, for example across bind
+        mounts which share a device, so the artifact has to be copied.
+        '''
+        source = beets.util.syspath(source_file)
+        dest = beets.util.syspath(dest_file)
+        try:
+            if six.PY2:
+                os.link(source, dest)
+            else:
+                os.link(source, dest, follow_symlinks=False)
+        except OSError as exc:
+            if exc.errno == errno.EXDEV:
+                return False
+            if exc.errno not in (errno.EPERM, errno.EMLINK,
+                                 errno.EOPNOTSUPP, errno.ENOSYS):
+                raise beets.util.FilesystemError(exc, 'rename',
+                                                 (source_file, dest_file))
+            return self._rename_unlinked(source_file, dest_file)
+        try:
+            os.unlink(source)
+        except OSError as exc:
+            raise beets.util.FilesystemError(exc, 'rename',
+                                             (source_file, dest_file))
+        return True
+
+    def _rename_unlinked(self, source_file, dest_file):
+        # Files created since the destination's directory was listed, by
+        # something other than this run, are still never replaced
+        if os.path.lexists(beets.util.syspath(dest_file)):
+            raise beets.util.FilesystemError('file exists', 'rename',
+                                             (source_file, dest_file))
+        try:
+            os.rename(beets.util.syspath(source_file),
+                      beets.util.syspath(dest_file))
+        except OSError as exc:
+            if exc.errno == errno.EXDEV:
+                return False
+            raise beets.util.FilesystemError(exc, 'rename',
+                                             (source_file, dest_file))
+        return True
 
-        dir_path = os.path.split(source_file)[0]
-        beets.util.prune_dirs(dir_path, clutter=config['clutter'].as_str_seq())
+    def _move_artifact(self, source_file, dest_file, digest=None):
+        source_dir = os.path.dirname(source_file)
+        dest_dir = os.path.dirname(dest_file)
+
+        with self._stats.timed('move'):
+            if (self._device(source_dir) == self._device(dest_dir) and
+                    self._rename(source_file, dest_file)):
+                self._stats.count('moved.rename')
+            else:
+                # Copy now and delete the source once the album's copies
+                # have all been made
+                self._copy(source_file, dest_file)
+                if self.fsync:
+                    self._fsync(dest_file)
+                self._moved_sources.append((source_file, dest_file))
+                self._stats.count('moved.copy')
+
+        if digest and self._digests:
+            self._digests.store(dest_file, digest)
+
+        # Pruned once the album's artifacts have all been moved
+        self._prune_dirs.add(os.path.split(source_file)[0])
+
+    def _fsync(self, path):
+        fd = os.open(beets.util.syspath(path), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _delete_moved_sources(self):
+        '''Deletes the sources of artifacts moved across filesystems by
+        copying them.
+        '''
+        moved, self._moved_sources = self._moved_sources, []
+        if self.fsync:
+            # Make sure the new directory entries are on disk before the
+            # originals go
+            for dest_dir in set(os.path.dirname(d) for _, d in moved):
+                self._fsync(dest_dir)
+
+        for source_file, _ in moved:
+            beets.util.remove(source_file)
+
+    def _prune_source_dirs(self):
+        '''Removes source directories left empty by moving artifacts, each
+        directory once and deepest first so that emptied parents go too.
+        '''
+        if not self._prune_dirs:
+            return
 
+        clutter = config['clutter'].as_str_seq()
+        # Reverse order sorts subdirectories before their parents
+        dirs = sorted(self._prune_dirs, reverse=True)
+        self._prune_dirs = set()
+        with self._stats.timed('prune'):
+            for dir_path in dirs:
+                beets.util.prune_dirs(dir_path, clutter=clutter)
@@ -1,5 +1,6 @@
 import sys
 import os
+import six
 import shutil
 import unittest
 import tempfile
@@ -0,0 +1,198 @@
+"""
+Benchmarks for copyartifacts against synthetic libraries.
+
+Generates a source tree of albums containing artifacts, then times the
+plugin's collect and process stages in copy, move and reimport modes,
+reporting wall time, filesystem calls, files per second and peak memory.
+
+    python -m tests.benchmark --albums 2000 --artifacts 10 --size 65536
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import tracemalloc
+from contextlib import contextmanager
+
+import beets
+from beets import config
+from beets import util
+from beets import library
+from beets import logging
+
+# Make sure the development versions of the plugins are used
+import beetsplug  # noqa: E402
+beetsplug.__path__ = [os.path.abspath(
+    os.path.join(__file__, '..', '..', 'beetsplug')
+)]
+
+from beetsplug import copyartifacts
+
+# Filesystem calls counted while a stage runs
+COUNTED_CALLS = ('stat', 'lstat', 'listdir', 'scandir', 'mkdir', 'rename',
+                 'remove', 'unlink', 'rmdir', 'link', 'symlink', 'open')
+
+
+class CallCounter(object):
+    """Counts calls to functions in the os module by temporarily wrapping
+    them.
+    """
+    def __init__(self):
+        self.counts = {}
+
+    def _wrap(self, name, func):
+        def wrapper(*args, **kwargs):
+            self.counts[name] = self.counts.get(name, 0) + 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    @contextmanager
+    def counting(self):
+        originals = {}
+        for name in COUNTED_CALLS:
+            if hasattr(os, name):
+                originals[name] = getattr(os, name)
+                setattr(os, name, self._wrap(name, originals[name]))
+        try:
+            yield self
+        finally:
+            for name, func in originals.items():
+                setattr(os, name, func)
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+
+def generate_library(root, albums, artifacts, size, depth):
+    """Creates ``albums`` album directories under ``root``, each holding a
+    track and ``artifacts`` files of ``size`` bytes spread over ``depth``
+    levels of subdirectories. Returns a list of track paths.
+    """
+    data = os.urandom(size)
+    tracks = []
+    for a in range(albums):
+        album_path = os.path.join(root, b'album%05d' % a)
+        os.makedirs(album_path)
+
+        track = os.path.join(album_path, b'track.mp3')
+        open(track, 'wb').close()
+        tracks.append(track)
+
+        for i in range(artifacts):
+            path = album_path
+            for d in range(i % (depth + 1)):
+                path = os.path.join(path, b'sub%d' % d)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            ext = (b'log', b'cue', b'jpg', b'pdf')[i % 4]
+            with open(os.path.join(path, b'artifact%d.' % i + ext), 'wb') as f:
+                f.write(data)
+
+    return tracks
+
+
+def setup_config(temp_dir, move, workers):
+    config.sources = []
+    config.read(user=False, defaults=True)
+    config['library'] = util.py3_path(os.path.join(temp_dir, b'library.db'))
+    config['import']['move'] = move
+    config['copyartifacts']['workers'] = workers
+
+    log = logging.getLogger('beets')
+    log.setLevel(logging.WARNING)
+
+
+def run_stage(name, func, files, results):
+    counter = CallCounter()
+    tracemalloc.start()
+    start = time.time()
+    with counter.counting():
+        func()
+    elapsed = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    results.append((name, elapsed, counter.total,
+                    files / elapsed if elapsed else float('inf'), peak))
+
+
+def run_mode(mode, args, work_dir):
+    """Runs one benchmark mode in a fresh directory, returning a list of
+    per-stage results.
+    """
+    src_dir = os.path.join(work_dir, b'src')
+    lib_dir = os.path.join(work_dir, b'lib')
+    os.makedirs(lib_dir)
+
+    setup_config(work_dir, mode != 'copy', args.workers)
+    tracks = generate_library(src_dir, args.albums, args.artifacts,
+                              args.size, args.depth)
+
+    if mode == 'reimport':
+        # Files start out in the library and move within it
+        shutil.move(src_dir, os.path.join(lib_dir, b'old'))
+        tracks = [os.path.join(lib_dir, b'old', t[len(src_dir) + 1:])
+                  for t in tracks]
+        source_root = os.path.join(lib_dir, b'old')
+        dest_root = os.path.join(lib_dir, b'new')
+    else:
+        source_root = src_dir
+        dest_root = lib_dir
+
+    plugin = copyartifacts.CopyArtifactsPlugin()
+    item = library.Item(artist=u'Artist', albumartist=u'Artist',
+                        album=u'Album')
+    files = args.albums * args.artifacts
+
+    def collect():
+        for track in tracks:
+            dest = os.path.join(dest_root, track[len(source_root) + 1:])
+            plugin.collect_artifacts(item, track, dest)
+
+    results = []
+    run_stage('collect', collect, files, results)
+    run_stage('process', plugin.process_events, files, results)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--albums', type=int, default=1000)
+    parser.add_argument('--artifacts', type=int, default=8,
+                        help='artifacts per album')
+    parser.add_argument('--size', type=int, default=4096,
+                        help='size of each artifact in bytes')
+    parser.add_argument('--depth', type=int, default=1,
+                        help='maximum nesting depth of artifacts')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--modes', nargs='+', default=['copy', 'move',
+                                                       'reimport'],
+                        choices=['copy', 'move', 'reimport'])
+    parser.add_argument('--dir', default=None,
+                        help='where to create the libraries, e.g. a tmpfs')
+    args = parser.parse_args(argv)
+
+    print(u'{0:<10} {1:<8} {2:>10} {3:>10} {4:>12} {5:>12}'.format(
+        u'mode', u'stage', u'seconds', u'fs calls', u'files/sec',
+        u'peak KiB'))
+    for mode in args.modes:
+        work_dir = util.bytestring_path(tempfile.mkdtemp(dir=args.dir))
+        try:
+            for stage, elapsed, calls, rate, peak in run_mode(mode, args,
+                                                              work_dir):
+                print(u'{0:<10} {1:<8} {2:>10.3f} {3:>10} {4:>12.0f} '
+                      u'{5:>12}'.format(mode, stage, elapsed, calls, rate,
+                                        peak // 1024))
+        finally:
+            shutil.rmtree(work_dir)
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(u'peak RSS: {0} KiB'.format(maxrss))
+
+
+if __name__ == '__main__':
+    main()
@@ -65,7 +65,7 @@ class CopyArtifactsTestCase(_common.TestCase):
         # Install the DummyIO to capture anything directed to stdout
         self.io.install()
 
-    def _run_importer(self):
+    def _run_importer(self, cli_exit=True):
         """
         Create an instance of the plugin, run the importer, and
         remove/unregister the plugin instance so a new instance can
@@ -73,6 +73,7 @@ class CopyArtifactsTestCase(_common.TestCase):
         This is a convenience method that can be called to setup, exercise
         and teardown the system under test after setting any config options
         and before assertions are made regarding changes to the filesystem.
+        If ``cli_exit`` is False the cli_exit event is not sent.
         """
         # Setup
         # Create an instance of the plugin
@@ -82,9 +83,42 @@ class CopyArtifactsTestCase(_common.TestCase):
         # Run the importer
         self.importer.run()
         # Fake the occurence of the cli_exit event
-        plugins.send('cli_exit', lib=self.lib)
+        if cli_exit:
+            plugins.send('cli_exit', lib=self.lib)
 
         # Teardown
+        self._unload_plugin()
+
+    def _run_command(self, *args):
+        """
+        Create an instance of the plugin, run the ``beet artifacts`` command
+        with ``args`` against the library, and remove/unregister the plugin
+        instance as ``_run_importer`` does.
+        """
+        plugins.find_plugins()
+
+        command = plugins.commands()[0]
+        opts, args = command.parser.parse_args(list(args))
+        command.func(self.lib, opts, args)
+        plugins.send('cli_exit', lib=self.lib)
+
+        self._unload_plugin()
+
+    def _run_move(self):
+        """
+        Create an instance of the plugin and move every album in the library
+        to its destination outside of the importer, as ``beet move`` does,
+        then remove/unregister the plugin instance as ``_run_importer`` does.
+        """
+        plugins.find_plugins()
+
+        for album in self.lib.albums():
+            album.move()
+        plugins.send('cli_exit', lib=self.lib)
+
+        self._unload_plugin()
+
+    def _unload_plugin(self):
         if plugins._instances:
             classes = list(plugins._classes)
 
@@ -201,7 +235,7 @@ class CopyArtifactsTestCase(_common.TestCase):
         config['import']['copy'] = copy
         config['import']['delete'] = delete
         config['import']['timid'] = True
-        config['threaded'] = False
+        config['threaded'] = threaded
         config['import']['singletons'] = singletons
         config['import']['move'] = move
         config['import']['autotag'] = autotag
@@ -0,0 +1,94 @@
+import os
+import sys
+import unittest
+
+from mock import patch
+
+from tests.helper import CopyArtifactsTestCase, capture_log, copyartifacts
+import tests.test_workers as test_workers
+from beets import config
+
+
+class AsyncioBackendMixin(object):
+    """
+    Runs the transfers of a test case with the asyncio backend
+    """
+    def setUp(self):
+        super(AsyncioBackendMixin, self).setUp()
+
+        config['copyartifacts']['backend'] = 'asyncio'
+        config['copyartifacts']['concurrency'] = 4
+
+
+@unittest.skipIf(copyartifacts.asyncio is None, 'asyncio not available')
+class CopyArtifactsAsyncioTest(AsyncioBackendMixin,
+        test_workers.CopyArtifactsWorkersTest):
+    """
+    Tests to check that artifacts are transferred correctly by the asyncio
+    backend
+    """
+    def test_print_ignored(self):
+        config['copyartifacts']['extensions'] = '.file2'
+        config['copyartifacts']['print_ignored'] = True
+
+        with capture_log() as logs:
+            self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file2')
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+
+        # check output log
+        logs = [line for line in logs if line.startswith('copyartifacts:')]
+        self.assertEqual(logs[0], 'copyartifacts: Ignored files:')
+        self.assertTrue('copyartifacts:    artifact.file' in logs)
+
+
+@unittest.skipIf(copyartifacts.asyncio is None, 'asyncio not available')
+class CopyArtifactsAsyncioStateTest(CopyArtifactsTestCase):
+    """
+    Tests to check that the digest cache and fingerprint store can be
+    written concurrently by the asyncio backend
+    """
+    def setUp(self):
+        super(CopyArtifactsAsyncioStateTest, self).setUp()
+
+        self._set_import_dir()
+        self.import_media = []
+        for i in range(12):
+            album = u'Tag Album {0}'.format(i)
+            album_path = os.path.join(self.import_dir,
+                                      u'album_{0}'.format(i).encode('utf8'))
+            os.makedirs(album_path)
+            with open(os.path.join(album_path, b'artifact.file'), 'w') as f:
+                f.write(album)
+            self.import_media.append(self._create_medium(
+                os.path.join(album_path, b'track_1.mp3'), b'full.mp3', album))
+
+        config['copyartifacts']['extensions'] = u'.file'
+        config['copyartifacts']['backend'] = 'asyncio'
+        config['copyartifacts']['digest_cache'] = True
+        config['copyartifacts']['skip_unchanged'] = True
+
+    def test_reimport_with_digest_cache_and_fingerprints(self):
+        self._setup_import_session(autotag=False)
+        self._run_importer()
+
+        # Artifacts changed in place are compared by digest on the next
+        # import, and copied alongside the old ones
+        for i in range(12):
+            path = os.path.join(self.import_dir,
+                                u'album_{0}'.format(i).encode('utf8'),
+                                b'artifact.file')
+            with open(path, 'w') as f:
+                f.write(u'TAG ALBUM {0}'.format(i))
+
+        self._setup_import_session(autotag=False)
+        # Hold digest writes uncommitted while fingerprints are stored, as
+        # when other albums' transfers are still running
+        with patch.object(copyartifacts.DigestCache, 'commit'):
+            self._run_importer()
+
+        for i in range(12):
+            album = u'Tag Album {0}'.format(i).encode('utf8')
+            self.assert_in_lib_dir(b'Tag Artist', album, b'artifact.file')
+            self.assert_in_lib_dir(b'Tag Artist', album, b'artifact.1.file')
@@ -0,0 +1,100 @@
+import os
+import sys
+
+from mock import patch
+
+from tests.helper import CopyArtifactsTestCase, copyartifacts
+from beets import config
+
+class CopyArtifactsCommandTest(CopyArtifactsTestCase):
+    """
+    Tests to check the artifacts command syncs artifacts for albums already
+    in the library
+    """
+    def setUp(self):
+        super(CopyArtifactsCommandTest, self).setUp()
+
+        self._create_flat_import_dir()
+        self._setup_import_session(autotag=False)
+
+        config['copyartifacts']['extensions'] = '.file'
+        self._run_importer()
+
+    def test_rename_artifacts_after_path_format_change(self):
+        config['paths']['ext:file'] = str('$albumpath/$album')
+        self._run_command()
+
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'Tag Album.file')
+
+    def test_query_without_matches(self):
+        config['paths']['ext:file'] = str('$albumpath/$album')
+        self._run_command(u'album:nonexistent')
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+
+    def test_pretend(self):
+        config['paths']['ext:file'] = str('$albumpath/$album')
+        self._run_command(u'--pretend')
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'Tag Album.file')
+        self.assertTrue(u'Tag Album.file' in self.io.getoutput())
+
+    def test_already_in_place(self):
+        self._run_command()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_number_of_files_in_dir(2, self.lib_dir, b'Tag Artist', b'Tag Album')
+
+    def test_pretend_resolves_collisions_within_album(self):
+        album_path = os.path.join(self.lib_dir, b'Tag Artist', b'Tag Album')
+        with open(os.path.join(album_path, b'artifact.file'), 'w') as f:
+            f.write('first')
+        with open(os.path.join(album_path, b'other.file'), 'w') as f:
+            f.write('second')
+        config['paths']['ext:file'] = str('$albumpath/$album')
+        self._run_command(u'--pretend')
+
+        output = self.io.getoutput()
+        self.assertTrue(u'Tag Album.file' in output)
+        self.assertTrue(u'Tag Album.1.file' in output)
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'Tag Album.file')
+
+    def test_resolve_collisions_within_album(self):
+        album_path = os.path.join(self.lib_dir, b'Tag Artist', b'Tag Album')
+        with open(os.path.join(album_path, b'artifact.file'), 'w') as f:
+            f.write('first')
+        with open(os.path.join(album_path, b'other.file'), 'w') as f:
+            f.write('second')
+        config['paths']['ext:file'] = str('$albumpath/$album')
+        self._run_command()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'Tag Album.file')
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'Tag Album.1.file')
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'other.file')
+
+    def test_repeated_runs_leave_collisions_in_place(self):
+        album_path = os.path.join(self.lib_dir, b'Tag Artist', b'Tag Album')
+        with open(os.path.join(album_path, b'artifact.file'), 'w') as f:
+            f.write('first')
+        with open(os.path.join(album_path, b'other.file'), 'w') as f:
+            f.write('second')
+        config['paths']['ext:file'] = str('$albumpath/$album')
+        for _ in range(2):
+            self._run_command()
+
+            with open(os.path.join(album_path, b'Tag Album.file')) as f:
+                self.assertEqual(f.read(), 'first')
+            with open(os.path.join(album_path, b'Tag Album.1.file')) as f:
+                self.assertEqual(f.read(), 'second')
+            self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'Tag Album.2.file')
+
+    def test_destination_listings_are_cleared_after_each_batch(self):
+        config['paths']['ext:file'] = str('$albumpath/$album')
+        with patch.object(copyartifacts.DestinationCache, 'clear') as clear:
+            self._run_command(u'--batch-size', u'1')
+
+        # Once for the album's batch, once for the empty final batch and
+        # once more at cli_exit
+        self.assertEqual(clear.call_count, 3)
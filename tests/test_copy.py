@@ -0,0 +1,65 @@
+import os
+import errno
+import sys
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from tests.helper import copyartifacts
+import beets.util
+
+class FastCopyTest(unittest.TestCase):
+    """
+    Tests to check that artifacts are copied intact by each copy mechanism
+    """
+    def setUp(self):
+        self.temp_dir = beets.util.bytestring_path(tempfile.mkdtemp())
+        self.source = os.path.join(self.temp_dir, b'source.file')
+        self.dest = os.path.join(self.temp_dir, b'dest.file')
+        self.data = os.urandom(300000)
+        with open(self.source, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def assert_copied(self):
+        with open(self.dest, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_copy(self):
+        mechanism = copyartifacts.fast_copy(self.source, self.dest,
+                                            preallocate=True)
+
+        self.assertTrue(mechanism in ('copy_file_range', 'sendfile', 'buffered'))
+        self.assert_copied()
+
+    def test_buffered_copy(self):
+        unsupported = OSError(errno.ENOSYS, 'Function not implemented')
+        with patch('os.copy_file_range', side_effect=unsupported, create=True), \
+                patch('os.sendfile', side_effect=unsupported, create=True):
+            mechanism = copyartifacts.fast_copy(self.source, self.dest,
+                                                buffer_size=4096)
+
+        self.assertEqual(mechanism, 'buffered')
+        self.assert_copied()
+
+    def test_existing_dest_is_not_overwritten(self):
+        open(self.dest, 'w').close()
+
+        with self.assertRaises(beets.util.FilesystemError):
+            copyartifacts.fast_copy(self.source, self.dest)
+        self.assertEqual(os.path.getsize(self.dest), 0)
+
+    def test_throttled_copy(self):
+        throttle = copyartifacts.Throttle(bytes_per_second=10 ** 9)
+        with patch.object(throttle, 'consume', wraps=throttle.consume) as consume:
+            copyartifacts.fast_copy(self.source, self.dest, buffer_size=65536,
+                                    throttle=throttle)
+
+        self.assert_copied()
+        self.assertEqual(sum(c[1]['nbytes'] for c in consume.call_args_list),
+                         len(self.data))
+        self.assertTrue(consume.call_count >= 5)
@@ -0,0 +1,140 @@
+import os
+import sys
+import errno
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mock import patch
+
+from tests.helper import copyartifacts
+import beets.util
+
+class DestinationCacheTest(unittest.TestCase):
+    """
+    Tests to check that destinations are claimed uniquely and directories
+    are created once
+    """
+    def setUp(self):
+        self.temp_dir = beets.util.bytestring_path(tempfile.mkdtemp())
+        self.album_dir = os.path.join(self.temp_dir, b'the_album')
+        os.mkdir(self.album_dir)
+        self.cache = copyartifacts.DestinationCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def path(self, name):
+        return os.path.join(self.album_dir, name)
+
+    def test_claim_free_name(self):
+        self.assertEqual(self.cache.claim(self.path(b'artifact.file')),
+                         self.path(b'artifact.file'))
+        self.assertTrue(self.cache.exists(self.path(b'artifact.file')))
+
+    def test_claims_are_numbered(self):
+        claims = [self.cache.claim(self.path(b'artifact.file'))
+                  for _ in range(3)]
+
+        self.assertEqual(claims, [self.path(b'artifact.file'),
+                                  self.path(b'artifact.1.file'),
+                                  self.path(b'artifact.2.file')])
+
+    def test_existing_file_is_numbered(self):
+        open(self.path(b'artifact.file'), 'w').close()
+
+        self.assertEqual(self.cache.claim(self.path(b'artifact.file')),
+                         self.path(b'artifact.1.file'))
+
+    def test_numbered_name_counts_on(self):
+        open(self.path(b'artifact.1.file'), 'w').close()
+
+        self.assertEqual(self.cache.claim(self.path(b'artifact.1.file')),
+                         self.path(b'artifact.2.file'))
+
+    def test_released_name_can_be_claimed_again(self):
+        open(self.path(b'artifact.file'), 'w').close()
+        self.assertTrue(self.cache.exists(self.path(b'artifact.file')))
+
+        # The file is moved away
+        os.rename(self.path(b'artifact.file'), self.path(b'other.file'))
+        self.cache.release(self.path(b'artifact.file'))
+
+        self.assertFalse(self.cache.exists(self.path(b'artifact.file')))
+        self.assertEqual(self.cache.claim(self.path(b'artifact.file')),
+                         self.path(b'artifact.file'))
+
+    def test_concurrent_claims_are_unique(self):
+        claims = []
+        start = threading.Event()
+
+        def claim():
+            start.wait()
+            claims.append(self.cache.claim(self.path(b'artifact.file')))
+
+        threads = [threading.Thread(target=claim) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(claims)), 8)
+
+    def test_makedirs(self):
+        dest = os.path.join(self.temp_dir, b'Artist', b'Album', b'artifact.file')
+        self.cache.makedirs(dest)
+
+        self.assertTrue(os.path.isdir(os.path.dirname(dest)))
+
+    def test_makedirs_checks_directory_once(self):
+        dest = os.path.join(self.temp_dir, b'Artist', b'Album', b'artifact.file')
+        self.cache.makedirs(dest)
+
+        with patch.object(copyartifacts, '_mkdirall') as mkdirall:
+            self.cache.makedirs(dest)
+        self.assertFalse(mkdirall.called)
+
+    def test_directories_created_concurrently(self):
+        dest = os.path.join(self.temp_dir, b'Artist', b'Album', b'artifact.file')
+        errors = []
+        start = threading.Event()
+
+        def makedirs():
+            start.wait()
+            try:
+                copyartifacts.DestinationCache().makedirs(dest)
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=makedirs) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(os.path.isdir(os.path.dirname(dest)))
+
+    def test_directory_created_by_another_process(self):
+        dest = os.path.join(self.temp_dir, b'Artist', b'artifact.file')
+        mkdir = os.mkdir
+
+        def racing_mkdir(path, *args):
+            # Another process creates the directory first
+            mkdir(path, *args)
+            raise OSError(errno.EEXIST, 'File exists')
+
+        with patch('os.mkdir', side_effect=racing_mkdir):
+            self.cache.makedirs(dest)
+        self.assertTrue(os.path.isdir(os.path.dirname(dest)))
+
+    def test_makedirs_failure_is_raised(self):
+        dest = os.path.join(self.temp_dir, b'Artist', b'artifact.file')
+        denied = OSError(errno.EACCES, 'Permission denied')
+
+        with patch('os.mkdir', side_effect=denied):
+            with self.assertRaises(beets.util.FilesystemError):
+                self.cache.makedirs(dest)
@@ -0,0 +1,55 @@
+import os
+import sys
+
+from mock import patch
+
+from tests.helper import CopyArtifactsTestCase, copyartifacts
+from beets import config
+
+class CopyArtifactsDigestCacheTest(CopyArtifactsTestCase):
+    """
+    Tests to check that artifacts already in the library are detected using
+    the digest cache
+    """
+    def setUp(self):
+        super(CopyArtifactsDigestCacheTest, self).setUp()
+
+        self._create_flat_import_dir()
+        with open(os.path.join(self.import_dir, b'the_album', b'artifact.file'), 'w') as f:
+            f.write('artifact')
+        self._setup_import_session(autotag=False)
+
+        config['copyartifacts']['extensions'] = u'.file'
+        config['copyartifacts']['digest_cache'] = True
+
+    def test_identical_artifact_is_not_copied_again(self):
+        self._run_importer()
+        # The first reimport hashes the copy and caches its digest
+        self._setup_import_session(autotag=False)
+        self._run_importer()
+        self._setup_import_session(autotag=False)
+        DigestCache = copyartifacts.DigestCache
+        with patch.object(DigestCache, 'digest', autospec=True,
+                          side_effect=DigestCache.digest) as digest, \
+                patch.object(DigestCache, '_hash', autospec=True,
+                             side_effect=DigestCache._hash) as hash_:
+            self._run_importer()
+
+        dest = os.path.join(self.lib_dir, b'Tag Artist', b'Tag Album', b'artifact.file')
+        # The destination's digest comes from the cache without reading it
+        self.assertTrue(dest in [c[0][1] for c in digest.call_args_list])
+        self.assertFalse(dest in [c[0][1] for c in hash_.call_args_list])
+
+        self.assertExists(os.path.join(self.temp_dir, b'copyartifacts.db'))
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.1.file')
+
+    def test_changed_artifact_is_copied_again(self):
+        self._run_importer()
+        with open(os.path.join(self.import_dir, b'the_album', b'artifact.file'), 'w') as f:
+            f.write('changed')
+        self._setup_import_session(autotag=False)
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.1.file')
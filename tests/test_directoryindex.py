@@ -0,0 +1,37 @@
+import os
+import sys
+import unittest
+
+from tests.helper import copyartifacts
+
+class DirectoryIndexTest(unittest.TestCase):
+    """
+    Tests to check the index of walked directories
+    """
+    def setUp(self):
+        self.index = copyartifacts.DirectoryIndex()
+        self.index.add(b'/music/the_album')
+
+    def test_walked_directory_is_seen(self):
+        self.assertTrue(b'/music/the_album' in self.index)
+        self.assertTrue(b'/music/the_album/' in self.index)
+
+    def test_subdirectory_of_walked_directory_is_seen(self):
+        self.assertTrue(b'/music/the_album/disc1' in self.index)
+
+    def test_sibling_and_parent_are_not_seen(self):
+        self.assertFalse(b'/music/the_album2' in self.index)
+        self.assertFalse(b'/music' in self.index)
+
+    def test_depth_limited_directory(self):
+        self.index.add(b'/music/outer', depth=1)
+
+        self.assertTrue(b'/music/outer' in self.index)
+        self.assertTrue(b'/music/outer/inner' in self.index)
+        self.assertFalse(b'/music/outer/inner/deeper' in self.index)
+
+    def test_exact_directory(self):
+        self.index.add(b'/music/outer', depth=0)
+
+        self.assertTrue(b'/music/outer' in self.index)
+        self.assertFalse(b'/music/outer/inner' in self.index)
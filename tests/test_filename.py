@@ -54,3 +54,14 @@ class CopyArtifactsFilename(CopyArtifactsTestCase):
 
         self.assert_in_lib_dir(b'Tag Artist', b'Tag Album_', b'Tag Artist - Tag Album_.file')
 
+
+    def test_album_fields_in_path_format(self):
+        config['paths']['ext:file'] = str('$albumpath/$artist - $album ($format)')
+
+        open(os.path.join(self.album_path, b'artifact.file'), 'a').close()
+        medium = self._create_medium(os.path.join(self.album_path, b'track_1.mp3'), b'full.mp3')
+        self.import_media = [medium]
+
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'Tag Artist - Tag Album (MP3).file')
@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import shutil
+
+from tests.helper import CopyArtifactsTestCase
+from beets import config
+
+import logging
+log = logging.getLogger("beets")
+
+class CopyArtifactsFingerprintTest(CopyArtifactsTestCase):
+    """
+    Tests to check that album directories which haven't changed since they
+    were last processed are skipped on reimport
+    """
+    def setUp(self):
+        super(CopyArtifactsFingerprintTest, self).setUp()
+
+        self._create_flat_import_dir()
+        self._setup_import_session(autotag=False)
+
+        self.stats_file = os.path.join(self.temp_dir, b'stats.json')
+        config['copyartifacts']['extensions'] = u'.file'
+        config['copyartifacts']['skip_unchanged'] = True
+        config['copyartifacts']['stats_file'] = self.stats_file.decode('utf8')
+
+        log.debug('--- initial import')
+        self._run_importer()
+
+    def _reimport(self):
+        self._setup_import_session(autotag=False,
+                                   import_dir=self.lib_dir,
+                                   move=True)
+        self._run_importer()
+
+        with open(self.stats_file) as f:
+            return json.load(f)['counters']
+
+    def test_unchanged_album_is_skipped(self):
+        log.debug('--- first reimport')
+        self._reimport()
+        log.debug('--- second reimport')
+        counters = self._reimport()
+
+        self.assertEqual(counters.get('skipped.unchanged'), 1)
+        self.assertTrue('walked' not in counters)
+        self.assert_number_of_files_in_dir(2, self.lib_dir, b'Tag Artist', b'Tag Album')
+
+    def test_new_artifact_is_processed(self):
+        self._reimport()
+        album_path = os.path.join(self.lib_dir, b'Tag Artist', b'Tag Album')
+        with open(os.path.join(album_path, b'new.file'), 'w') as f:
+            f.write('new')
+        counters = self._reimport()
+
+        self.assertTrue('skipped.unchanged' not in counters)
+        self.assertEqual(counters['walked'], 2)
+
+    def test_changed_path_format_is_processed(self):
+        self._reimport()
+        config['paths']['ext:file'] = str(os.path.join('$albumpath', '$album'))
+        counters = self._reimport()
+
+        self.assertTrue('skipped.unchanged' not in counters)
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'Tag Album.file')
+
+    def test_removed_destination_is_processed(self):
+        shutil.rmtree(os.path.join(self.lib_dir, b'Tag Artist'))
+        self._setup_import_session(autotag=False)
+        self._run_importer()
+
+        with open(self.stats_file) as f:
+            counters = json.load(f)['counters']
+        self.assertTrue('skipped.unchanged' not in counters)
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+
+from tests.helper import CopyArtifactsTestCase
+from beets import config
+
+class CopyArtifactsIndexTest(CopyArtifactsTestCase):
+    """
+    Tests to check that artifacts recorded in the index are relocated with
+    their album when it is moved outside the importer
+    """
+    def setUp(self):
+        super(CopyArtifactsIndexTest, self).setUp()
+
+        self._create_flat_import_dir()
+        scans_path = os.path.join(self.import_dir, b'the_album', b'scans')
+        os.makedirs(scans_path)
+        open(os.path.join(scans_path, b'front.file'), 'a').close()
+        self._setup_import_session(autotag=False)
+
+        self.stats_file = os.path.join(self.temp_dir, b'stats.json')
+        config['copyartifacts']['extensions'] = u'.file'
+        config['copyartifacts']['index'] = True
+        config['copyartifacts']['stats_file'] = self.stats_file.decode('utf8')
+
+        self._run_importer()
+
+    def _counters(self):
+        with open(self.stats_file) as f:
+            return json.load(f)['counters']
+
+    def test_artifacts_recorded(self):
+        with self.lib.transaction() as tx:
+            rows = tx.query('SELECT path FROM copyartifacts')
+
+        album_path = os.path.join(self.lib_dir, b'Tag Artist', b'Tag Album')
+        self.assertEqual(sorted(bytes(row[0]) for row in rows), [
+            os.path.join(album_path, b'artifact.file'),
+            os.path.join(album_path, b'scans', b'front.file'),
+        ])
+
+    def test_move_relocates_indexed_artifacts(self):
+        self.lib.path_formats[0] = ('default', os.path.join('1$artist', '$album', '$title'))
+        self._run_move()
+
+        counters = self._counters()
+        self.assertEqual(counters['relocated'], 2)
+        self.assertTrue('walked' not in counters)
+        self.assert_in_lib_dir(b'1Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_in_lib_dir(b'1Tag Artist', b'Tag Album', b'scans', b'front.file')
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album')
+
+    def test_index_follows_repeated_moves(self):
+        self.lib.path_formats[0] = ('default', os.path.join('1$artist', '$album', '$title'))
+        self._run_move()
+        self.lib.path_formats[0] = ('default', os.path.join('2$artist', '$album', '$title'))
+        self._run_move()
+
+        self.assertEqual(self._counters()['relocated'], 2)
+        self.assert_in_lib_dir(b'2Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_in_lib_dir(b'2Tag Artist', b'Tag Album', b'scans', b'front.file')
+        self.assert_not_in_lib_dir(b'1Tag Artist', b'Tag Album')
+
+    def test_unindexed_album_is_walked(self):
+        with self.lib.transaction() as tx:
+            tx.mutate('DELETE FROM copyartifacts')
+        self.lib.path_formats[0] = ('default', os.path.join('1$artist', '$album', '$title'))
+        self._run_move()
+
+        counters = self._counters()
+        self.assertTrue('relocated' not in counters)
+        self.assertEqual(counters['walked'], 2)
+        self.assert_in_lib_dir(b'1Tag Artist', b'Tag Album', b'artifact.file')
@@ -0,0 +1,103 @@
+import os
+import sys
+
+from mock import patch
+
+from tests.helper import CopyArtifactsTestCase, copyartifacts
+from beets import config
+from beets import plugins
+
+class CopyArtifactsJournalTest(CopyArtifactsTestCase):
+    """
+    Tests to check that artifact work left unfinished by an interrupted
+    import is resumed from the journal
+    """
+    def setUp(self):
+        super(CopyArtifactsJournalTest, self).setUp()
+
+        self._create_flat_import_dir()
+        self._setup_import_session(autotag=False)
+
+        config['copyartifacts']['extensions'] = '.file'
+        config['copyartifacts']['journal'] = True
+
+        self.journal = os.path.join(self.temp_dir, b'copyartifacts.journal')
+
+    def test_journal_removed_after_completed_import(self):
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assertNotExists(self.journal)
+
+    def test_interrupted_import_is_resumed(self):
+        # No cli_exit, as if beets was killed after the import
+        self._run_importer(cli_exit=False)
+
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assertExists(self.journal)
+
+        # Import of another album replays the unfinished work first
+        other_dir = os.path.join(self.temp_dir, b'other_album')
+        os.makedirs(other_dir)
+        self._setup_import_session(autotag=False, import_dir=other_dir)
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assertNotExists(self.journal)
+
+    def test_journal_kept_by_other_commands(self):
+        self._run_importer(cli_exit=False)
+
+        # A command other than import, such as beet ls, exits normally
+        plugins.find_plugins()
+        plugins.send('cli_exit', lib=self.lib)
+        self._unload_plugin()
+
+        self.assertExists(self.journal)
+
+        other_dir = os.path.join(self.temp_dir, b'other_album')
+        os.makedirs(other_dir)
+        self._setup_import_session(autotag=False, import_dir=other_dir)
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assertNotExists(self.journal)
+
+    def test_interrupted_move_is_replayed_as_move(self):
+        self._run_importer()
+        config['paths']['ext:file'] = str('$albumpath/$album')
+        item = self.lib.items().get()
+        album_path = os.path.dirname(item.path)
+        artifact = copyartifacts.Artifact(
+            os.path.join(album_path, b'artifact.file'), 0, 0.0)
+
+        # Work queued by the artifacts command before beets was killed
+        journal = copyartifacts.Journal(self.journal)
+        journal.queued(item.id, album_path, album_path, [artifact], True)
+        journal.close()
+
+        other_dir = os.path.join(self.temp_dir, b'other_album')
+        os.makedirs(other_dir)
+        self._setup_import_session(autotag=False, import_dir=other_dir)
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'Tag Album.file')
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assertNotExists(self.journal)
+
+    def test_crash_while_rewriting_keeps_pending_work(self):
+        artifact = copyartifacts.Artifact(
+            os.path.join(self.import_dir, b'the_album', b'artifact.file'), 0, 0.0)
+        journal = copyartifacts.Journal(self.journal)
+        journal.queued(1, self.import_dir, self.lib_dir, [artifact])
+        journal.close()
+
+        # Interrupted before the rewritten journal is complete
+        with patch('os.fsync', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                copyartifacts.Journal(self.journal)
+
+        journal = copyartifacts.Journal(self.journal)
+        self.assertEqual(len(journal.pending), 1)
+        self.assertEqual(journal.pending[0][5], [artifact])
+        journal.close()
@@ -0,0 +1,119 @@
+import os
+import sys
+
+from tests.helper import CopyArtifactsTestCase, capture_log
+from beets import config
+
+class CopyArtifactsLimitsTest(CopyArtifactsTestCase):
+    """
+    Tests to check that album directories exceeding the scan limits are
+    skipped
+    """
+    def setUp(self):
+        super(CopyArtifactsLimitsTest, self).setUp()
+
+        self._create_flat_import_dir()
+        scans_path = os.path.join(self.import_dir, b'the_album', b'scans')
+        os.makedirs(scans_path)
+        with open(os.path.join(scans_path, b'front.file'), 'w') as f:
+            f.write('front')
+
+        self._setup_import_session(autotag=False)
+
+    def test_no_limits_by_default(self):
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'scans', b'front.file')
+
+    def test_max_depth(self):
+        config['copyartifacts']['max_depth'] = 0
+
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'scans')
+
+    def test_max_files(self):
+        config['copyartifacts']['max_files'] = 2
+
+        with capture_log() as logs:
+            self._run_importer()
+
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assertTrue(any(line.startswith('copyartifacts: Skipping artifacts of')
+                            for line in logs))
+
+    def test_max_files_ignores_media_files(self):
+        album_path = os.path.join(self.import_dir, b'the_album')
+        for i in range(2, 6):
+            self.import_media.append(self._create_medium(
+                os.path.join(album_path, u'track_{0}.mp3'.format(i).encode('utf8')),
+                b'full.mp3'))
+        config['copyartifacts']['max_files'] = 3
+
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file2')
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'scans', b'front.file')
+
+    def test_max_entries(self):
+        config['copyartifacts']['max_entries'] = 3
+
+        with capture_log() as logs:
+            self._run_importer()
+
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assertTrue(any(line.startswith('copyartifacts: Skipping artifacts of')
+                            for line in logs))
+
+    def test_max_bytes(self):
+        config['copyartifacts']['max_bytes'] = 4
+
+        self._run_importer()
+
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'scans')
+
+
+class CopyArtifactsNestedLimitsTest(CopyArtifactsTestCase):
+    """
+    Tests to check that albums nested inside a directory that was only
+    partly walked still get their artifacts
+    """
+    def setUp(self):
+        super(CopyArtifactsNestedLimitsTest, self).setUp()
+
+        self._set_import_dir()
+        outer_path = os.path.join(self.import_dir, b'outer')
+        inner_path = os.path.join(outer_path, b'inner')
+        os.makedirs(inner_path)
+        with open(os.path.join(outer_path, b'outer.file'), 'w') as f:
+            f.write('outer')
+        open(os.path.join(inner_path, b'inner.file'), 'w').close()
+        self.import_media = [
+            self._create_medium(os.path.join(outer_path, b'track_1.mp3'),
+                                b'full.mp3', 'Outer'),
+            self._create_medium(os.path.join(inner_path, b'track_1.mp3'),
+                                b'full.mp3', 'Inner'),
+        ]
+
+        self._setup_import_session(autotag=False)
+
+    def test_max_depth_with_nested_album(self):
+        config['copyartifacts']['max_depth'] = 0
+
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Outer', b'outer.file')
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Outer', b'inner')
+        self.assert_in_lib_dir(b'Tag Artist', b'Inner', b'inner.file')
+
+    def test_max_bytes_with_nested_album(self):
+        config['copyartifacts']['max_bytes'] = 0
+
+        self._run_importer()
+
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Outer', b'outer.file')
+        self.assert_in_lib_dir(b'Tag Artist', b'Inner', b'inner.file')
@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+
+from tests.helper import CopyArtifactsTestCase, copyartifacts
+from beets import config
+
+class ArtifactMatcherTest(unittest.TestCase):
+    """
+    Tests to check matching of artifacts against configured extensions and
+    patterns
+    """
+    def test_match_all(self):
+        matcher = copyartifacts.ArtifactMatcher(['.*'])
+        self.assertTrue(matcher(b'artifact.file'))
+        self.assertTrue(matcher(b'scans/front.jpg'))
+
+    def test_plain_extensions(self):
+        matcher = copyartifacts.ArtifactMatcher(['.cue', '.log'])
+        self.assertTrue(matcher(b'album.cue'))
+        self.assertTrue(matcher(b'disc1/rip.log'))
+        self.assertFalse(matcher(b'cover.jpg'))
+
+    def test_name_glob_matches_in_any_directory(self):
+        matcher = copyartifacts.ArtifactMatcher(['*.jpg'])
+        self.assertTrue(matcher(b'cover.jpg'))
+        self.assertTrue(matcher(b'scans/back.jpg'))
+        self.assertFalse(matcher(b'cover.png'))
+
+    def test_path_glob(self):
+        matcher = copyartifacts.ArtifactMatcher(['scans/**', 'disc?/*.log'])
+        self.assertTrue(matcher(b'scans/front.png'))
+        self.assertTrue(matcher(b'scans/booklet/page1.png'))
+        self.assertTrue(matcher(b'disc1/rip.log'))
+        self.assertFalse(matcher(b'disc1/extra/rip.log'))
+        self.assertFalse(matcher(b'front.png'))
+
+
+class CopyArtifactsPatternTest(CopyArtifactsTestCase):
+    """
+    Tests to check that artifacts are filtered by glob patterns on import
+    """
+    def setUp(self):
+        super(CopyArtifactsPatternTest, self).setUp()
+
+        self._create_flat_import_dir()
+        self._setup_import_session(autotag=False)
+
+    def test_copy_matching_pattern(self):
+        config['copyartifacts']['extensions'] = 'artifact.file?'
+
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file2')
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
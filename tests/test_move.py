@@ -0,0 +1,99 @@
+import os
+import sys
+import errno
+
+import beets.util
+
+from mock import patch
+
+from tests.helper import CopyArtifactsTestCase, copyartifacts
+from beets import config
+from beets import plugins
+
+class CopyArtifactsMoveTest(CopyArtifactsTestCase):
+    """
+    Tests to check that artifacts are renamed when moved within a filesystem
+    and copied then deleted when moved across filesystems
+    """
+    def setUp(self):
+        super(CopyArtifactsMoveTest, self).setUp()
+
+        self._create_flat_import_dir()
+        self._setup_import_session(autotag=False, move=True)
+
+        self.source = os.path.join(self.import_dir, b'the_album', b'artifact.file')
+        self.inode = os.stat(self.source).st_ino
+
+    def test_move_within_filesystem_renames(self):
+        self._run_importer()
+
+        dest = os.path.join(self.lib_dir, b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assertEqual(os.stat(dest).st_ino, self.inode)
+        self.assert_not_in_import_dir(b'the_album')
+
+    def test_move_across_filesystems_copies_and_deletes(self):
+        config['copyartifacts']['fsync'] = True
+
+        def device(plugin, directory):
+            return 1 if directory.startswith(self.import_dir) else 2
+
+        with patch.object(copyartifacts.CopyArtifactsPlugin, '_device', device):
+            self._run_importer()
+
+        dest = os.path.join(self.lib_dir, b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assertNotEqual(os.stat(dest).st_ino, self.inode)
+        self.assert_not_in_import_dir(b'the_album')
+
+    def test_rename_across_bind_mounts_copies_and_deletes(self):
+        # Bind mounts share a device but can't be linked or renamed across
+        cross_device = OSError(errno.EXDEV, 'Invalid cross-device link')
+        with patch('os.link', side_effect=cross_device):
+            self._run_importer()
+
+        dest = os.path.join(self.lib_dir, b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assertNotEqual(os.stat(dest).st_ino, self.inode)
+        self.assert_not_in_import_dir(b'the_album')
+
+    def test_rename_without_hard_links_keeps_inode(self):
+        # vfat and many CIFS mounts can rename but not link
+        unsupported = OSError(errno.EPERM, 'Operation not permitted')
+        with patch('os.link', side_effect=unsupported):
+            self._run_importer()
+
+        dest = os.path.join(self.lib_dir, b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assertEqual(os.stat(dest).st_ino, self.inode)
+        self.assert_not_in_import_dir(b'the_album')
+
+    def test_rename_without_hard_links_does_not_replace_existing_dest(self):
+        dest = os.path.join(self.import_dir, b'the_album', b'existing.file')
+        with open(dest, 'w') as f:
+            f.write('existing')
+
+        unsupported = OSError(errno.EOPNOTSUPP, 'Operation not supported')
+        plugin = plugins.find_plugins()[0]
+        try:
+            with patch('os.link', side_effect=unsupported):
+                with self.assertRaises(beets.util.FilesystemError):
+                    plugin._move_artifact(self.source, dest)
+        finally:
+            self._unload_plugin()
+
+        with open(dest) as f:
+            self.assertEqual(f.read(), 'existing')
+        self.assertTrue(os.path.exists(self.source))
+
+    def test_rename_does_not_replace_existing_dest(self):
+        dest = os.path.join(self.import_dir, b'the_album', b'existing.file')
+        with open(dest, 'w') as f:
+            f.write('existing')
+
+        plugin = plugins.find_plugins()[0]
+        try:
+            with self.assertRaises(beets.util.FilesystemError):
+                plugin._move_artifact(self.source, dest)
+        finally:
+            self._unload_plugin()
+
+        with open(dest) as f:
+            self.assertEqual(f.read(), 'existing')
+        self.assertTrue(os.path.exists(self.source))
@@ -10,3 +10,19 @@ class CopyArtifactsFromNestedDirectoryTest(CopyArtifactsTestCase):
     structure. i.e. songs in an album are imported from two directories corresponding to
     disc numbers or flat option is used
     """
+    def test_prune_nested_directories_with_move(self):
+        self._set_import_dir()
+        album_path = os.path.join(self.import_dir, b'the_album')
+        scans_path = os.path.join(album_path, b'scans')
+        os.makedirs(scans_path)
+        open(os.path.join(album_path, b'artifact.file'), 'a').close()
+        open(os.path.join(scans_path, b'front.file'), 'a').close()
+        medium = self._create_medium(os.path.join(album_path, b'track_1.mp3'), b'full.mp3')
+        self.import_media = [medium]
+
+        self._setup_import_session(autotag=False, move=True)
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'scans', b'front.file')
+        self.assert_not_in_import_dir(b'the_album')
@@ -0,0 +1,76 @@
+import os
+import sys
+import gc
+import unittest
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+from mock import patch
+
+from tests.helper import copyartifacts
+from beets import library
+from beets import plugins
+
+class QueuedAlbumTest(unittest.TestCase):
+    """
+    Tests to check the compact representation of queued artifacts
+    """
+    def _artifacts(self, source, count):
+        return [copyartifacts.Artifact(
+                    os.path.join(source, u'scans/image_{0:04d}.jpg'.format(i).encode('utf8')),
+                    123456 + i, 1400000000.5 + i)
+                for i in range(count)]
+
+    def test_artifacts_round_trip(self):
+        source = b'/music/incoming/the_album'
+        artifacts = self._artifacts(source, 3)
+        artifacts.append(copyartifacts.Artifact(
+            os.path.join(source, b'artifact.file'), 2 ** 40, 0.0))
+
+        album = copyartifacts.QueuedAlbum(source, artifacts, None)
+
+        self.assertEqual(len(album), 4)
+        self.assertEqual(album.names[-1], b'artifact.file')
+        self.assertEqual(album.artifacts(), artifacts)
+
+    @unittest.skipIf(tracemalloc is None, 'tracemalloc is not available')
+    # Looking up items would otherwise instantiate the plugin
+    @patch.object(plugins, '_classes', set())
+    def test_bytes_per_queued_artifact(self):
+        lib = library.Library(':memory:')
+        albums = []
+        for i in range(50):
+            source = u'/media/incoming/Some Artist - Some Album {0:04d} (2014) [FLAC]'.format(i).encode('utf8')
+            item = library.Item(artist=u'Some Artist', title=u'Some Title',
+                                album=u'Some Album {0:04d}'.format(i))
+            albums.append((lib.add(item), source, self._artifacts(source, 200)))
+        del item
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            queued = []
+            for item_id, source, artifacts in albums:
+                # As collected: the item is only referenced while queueing,
+                # and fields looked up for the fingerprint are kept
+                mapping = copyartifacts.ArtifactMapping(
+                    lib.get_item(item_id), source.replace(b'incoming', b'library'))
+                mapping['album']
+                mapping.unload()
+                queued.append(copyartifacts.QueuedAlbum(source, artifacts, mapping))
+            del mapping
+            gc.collect()
+            used = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(sum(len(album) for album in queued), 10000)
+        self.assertTrue(used / 10000.0 < 100,
+                        '{0:.1f} bytes per queued artifact'.format(used / 10000.0))
+        self.assertEqual(queued[0].mapping['album'], u'Some Album 0000')
+        self.assertEqual(queued[0].mapping['title'], u'Some Title')
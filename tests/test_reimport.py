@@ -149,7 +149,6 @@ class CopyArtifactsReimportTest(CopyArtifactsTestCase):
         self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
         self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'Tag Album.file')
 
-    @unittest.skip('Todo')
     def test_multiple_reimport_artifacts_with_move(self):
         # Cause files to relocate when reimported
         #self.lib.path_formats[0] = ('default', os.path.join('1$artist', '$album', '$title'))
@@ -0,0 +1,98 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from tests.helper import copyartifacts
+import beets.util
+
+class ScanArtifactsTest(unittest.TestCase):
+    """
+    Tests to check that album directories are walked in order and that
+    ignored names are skipped
+    """
+    def setUp(self):
+        self.temp_dir = beets.util.bytestring_path(tempfile.mkdtemp())
+        for name in [b'b.file', b'A.file', b'c.file', b'.DS_Store',
+                     os.path.join(b'Disc2', b'z.file'),
+                     os.path.join(b'disc1', b'y.file'),
+                     os.path.join(b'@eaDir', b'thumb.jpg')]:
+            path = os.path.join(self.temp_dir, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.mkdir(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(name.decode('utf8'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def scan(self, **kwargs):
+        return [os.path.relpath(a.path, self.temp_dir)
+                for a in copyartifacts.scan_artifacts(self.temp_dir, **kwargs)]
+
+    def test_sorted_order(self):
+        self.assertEqual(self.scan(ignore=[u'.*', u'@eaDir']),
+                         [b'A.file', b'b.file', b'c.file',
+                          os.path.join(b'disc1', b'y.file'),
+                          os.path.join(b'Disc2', b'z.file')])
+
+    def test_ignored_files_and_directories_are_skipped(self):
+        scanned = self.scan(ignore=[u'.*', u'@eaDir', u'b.*', u'Disc2'])
+
+        self.assertEqual(scanned, [b'A.file', b'c.file',
+                                   os.path.join(b'disc1', b'y.file')])
+
+    def test_nothing_is_ignored_by_default(self):
+        scanned = self.scan()
+
+        self.assertTrue(b'.DS_Store' in scanned)
+        self.assertTrue(os.path.join(b'@eaDir', b'thumb.jpg') in scanned)
+
+    def test_sizes_and_mtimes(self):
+        for artifact in copyartifacts.scan_artifacts(self.temp_dir):
+            stat = os.stat(artifact.path)
+            self.assertEqual(artifact.size, stat.st_size)
+            self.assertEqual(artifact.mtime, stat.st_mtime)
+
+    def test_skip_dir_and_max_depth(self):
+        skip = os.path.join(self.temp_dir, b'disc1')
+
+        self.assertEqual(self.scan(ignore=[u'.*'],
+                                   skip_dir=lambda d: d == skip),
+                         [b'A.file', b'b.file', b'c.file',
+                          os.path.join(b'@eaDir', b'thumb.jpg'),
+                          os.path.join(b'Disc2', b'z.file')])
+        self.assertEqual(self.scan(ignore=[u'.*'], max_depth=0),
+                         [b'A.file', b'b.file', b'c.file'])
+
+    def test_missing_directory(self):
+        missing = os.path.join(self.temp_dir, b'missing')
+
+        self.assertEqual(list(copyartifacts.scan_artifacts(missing)), [])
+
+    @unittest.skipIf(not hasattr(os, 'scandir'), 'os.scandir is unavailable')
+    def test_listdir_fallback(self):
+        expected = list(copyartifacts.scan_artifacts(self.temp_dir))
+
+        scandir = os.scandir
+        del os.scandir
+        try:
+            with patch.object(copyartifacts, '_DirEntry',
+                              wraps=copyartifacts._DirEntry) as dir_entry:
+                scanned = list(copyartifacts.scan_artifacts(self.temp_dir))
+        finally:
+            os.scandir = scandir
+
+        self.assertTrue(dir_entry.called)
+        self.assertEqual(scanned, expected)
+
+    def test_dir_entry(self):
+        entry = copyartifacts._DirEntry(self.temp_dir, b'A.file')
+
+        self.assertEqual(entry.path, os.path.join(self.temp_dir, b'A.file'))
+        self.assertFalse(entry.is_dir())
+        self.assertEqual(entry.stat().st_size, len(u'A.file'))
+        self.assertTrue(copyartifacts._DirEntry(self.temp_dir, b'disc1').is_dir())
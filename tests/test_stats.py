@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+
+from tests.helper import CopyArtifactsTestCase
+from beets import config
+from beets import plugins
+
+class CopyArtifactsStatsTest(CopyArtifactsTestCase):
+    """
+    Tests to check the statistics recorded while processing artifacts
+    """
+    def setUp(self):
+        super(CopyArtifactsStatsTest, self).setUp()
+
+        self._create_flat_import_dir()
+        self._setup_import_session(autotag=False)
+
+        self.stats_file = os.path.join(self.temp_dir, b'stats.json')
+        config['copyartifacts']['stats_file'] = self.stats_file.decode('utf8')
+
+    def test_stats_file_written(self):
+        config['copyartifacts']['extensions'] = '.file'
+
+        self._run_importer()
+
+        with open(self.stats_file) as f:
+            stats = json.load(f)
+
+        self.assertEqual(stats['counters']['walked'], 2)
+        self.assertEqual(stats['counters']['files'], 1)
+        self.assertEqual(stats['counters']['skipped.extension'], 1)
+        self.assertTrue('walk' in stats['durations'])
+        self.assertTrue('copy' in stats['durations'])
+
+    def test_stats_file_kept_by_other_commands(self):
+        self._run_importer()
+
+        # Another command, such as 'beet ls', exits without collecting
+        plugins.find_plugins()
+        plugins.send('cli_exit', lib=self.lib)
+        self._unload_plugin()
+
+        with open(self.stats_file) as f:
+            stats = json.load(f)
+        self.assertEqual(stats['counters']['walked'], 2)
@@ -0,0 +1,38 @@
+import os
+import sys
+
+from tests.helper import CopyArtifactsTestCase
+from beets import config
+
+class CopyArtifactsStreamingTest(CopyArtifactsTestCase):
+    """
+    Tests to check that artifacts are transferred as each album is imported
+    when streaming is enabled
+    """
+    def setUp(self):
+        super(CopyArtifactsStreamingTest, self).setUp()
+
+        self._create_flat_import_dir()
+        self._setup_import_session(autotag=False)
+
+    def test_artifacts_transferred_before_cli_exit(self):
+        config['copyartifacts']['streaming'] = True
+
+        self._run_importer(cli_exit=False)
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file2')
+
+    def test_artifacts_held_until_cli_exit_by_default(self):
+        self._run_importer(cli_exit=False)
+
+        self.assert_not_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+
+    def test_streaming_move(self):
+        config['copyartifacts']['streaming'] = True
+        config['import']['move'] = True
+
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_not_in_import_dir(b'the_album', b'artifact.file')
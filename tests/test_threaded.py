@@ -0,0 +1,99 @@
+import os
+import sys
+import threading
+
+from tests.helper import CopyArtifactsTestCase
+import tests.test_flatdirectory as test_flatdirectory
+import tests.test_nesteddirectory as test_nesteddirectory
+import tests.test_reimport as test_reimport
+import tests.test_streaming as test_streaming
+from beets import config
+from beets import plugins
+
+
+class ThreadedImportMixin(object):
+    """
+    Runs the import sessions of a test case with beets' threaded pipeline
+    """
+    def _setup_import_session(self, *args, **kwargs):
+        kwargs['threaded'] = True
+        super(ThreadedImportMixin, self)._setup_import_session(*args, **kwargs)
+
+
+class ThreadedFlatDirectoryTest(ThreadedImportMixin,
+        test_flatdirectory.CopyArtifactsFromFlatDirectoryTest):
+    pass
+
+
+class ThreadedNestedDirectoryTest(ThreadedImportMixin,
+        test_nesteddirectory.CopyArtifactsFromNestedDirectoryTest):
+    pass
+
+
+class ThreadedReimportTest(ThreadedImportMixin,
+        test_reimport.CopyArtifactsReimportTest):
+    pass
+
+
+class ThreadedStreamingTest(ThreadedImportMixin,
+        test_streaming.CopyArtifactsStreamingTest):
+    pass
+
+
+class CopyArtifactsThreadedTest(CopyArtifactsTestCase):
+    """
+    Tests to check that artifacts are collected once when events are
+    delivered from several threads
+    """
+    def setUp(self):
+        super(CopyArtifactsThreadedTest, self).setUp()
+
+        self._set_import_dir()
+        self.import_media = []
+        for i in range(8):
+            album = u'Tag Album {0}'.format(i)
+            album_path = os.path.join(self.import_dir,
+                                      u'album_{0}'.format(i).encode('utf8'))
+            os.makedirs(album_path)
+            with open(os.path.join(album_path, b'artifact.file'), 'w') as f:
+                f.write(album)
+            self.import_media.append(self._create_medium(
+                os.path.join(album_path, b'track_1.mp3'), b'full.mp3', album))
+
+        config['copyartifacts']['extensions'] = u'.file'
+        config['copyartifacts']['workers'] = 4
+
+    def test_threaded_import_of_many_albums(self):
+        self._setup_import_session(autotag=False, threaded=True, move=True)
+        self._run_importer()
+
+        for i in range(8):
+            album = u'Tag Album {0}'.format(i).encode('utf8')
+            self.assert_in_lib_dir(b'Tag Artist', album, b'artifact.file')
+            self.assert_number_of_files_in_dir(2, self.lib_dir, b'Tag Artist', album)
+        self.assert_number_of_files_in_dir(0, self.import_dir)
+
+    def test_concurrent_events_collect_directory_once(self):
+        self._setup_import_session(autotag=False)
+        self._run_importer()
+
+        plugin = plugins.find_plugins()[0]
+        try:
+            item = self.lib.items().get()
+            start = threading.Event()
+
+            def deliver():
+                start.wait()
+                plugin.collect_artifacts(item, item.path, item.path)
+
+            threads = [threading.Thread(target=deliver) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            start.set()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(len(plugin._process_queue), 1)
+        finally:
+            plugin._process_queue.clear()
+            self._unload_plugin()
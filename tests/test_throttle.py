@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import threading
+import unittest
+
+from mock import patch
+
+from tests.helper import CopyArtifactsTestCase, copyartifacts
+from beets import config
+
+class ThrottleTest(unittest.TestCase):
+    """
+    Tests to check the token buckets limiting the rate of transfers
+    """
+    def test_burst_within_rate_does_not_wait(self):
+        throttle = copyartifacts.Throttle(bytes_per_second=1000)
+        with patch.object(copyartifacts.time, 'sleep') as sleep:
+            throttle.consume(nbytes=1000)
+
+        self.assertFalse(sleep.called)
+
+    def test_waits_for_tokens_over_rate(self):
+        throttle = copyartifacts.Throttle(bytes_per_second=1000,
+                                          files_per_second=10)
+        with patch.object(copyartifacts.time, 'sleep') as sleep:
+            throttle.consume(nbytes=1000)
+            throttle.consume(nbytes=500)
+            throttle.consume(nbytes=500)
+
+        delays = [call[0][0] for call in sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertAlmostEqual(delays[0], 0.5, places=1)
+        self.assertAlmostEqual(delays[1], 1.0, places=1)
+
+    def test_files_limited_separately(self):
+        throttle = copyartifacts.Throttle(files_per_second=2)
+        with patch.object(copyartifacts.time, 'sleep') as sleep:
+            throttle.consume(nbytes=10 ** 9, files=2)
+            self.assertFalse(sleep.called)
+            throttle.consume(files=1)
+
+        self.assertAlmostEqual(sleep.call_args[0][0], 0.5, places=1)
+
+    def test_unlimited(self):
+        self.assertFalse(copyartifacts.Throttle())
+        self.assertTrue(copyartifacts.Throttle(files_per_second=1))
+
+
+    def test_idle_priority_only_set_per_thread_on_linux(self):
+        # Elsewhere the nice value is the whole process's
+        with patch('sys.platform', 'darwin'), \
+                patch('os.setpriority', create=True) as setpriority:
+            self.assertFalse(copyartifacts.idle_priority())
+        self.assertFalse(setpriority.called)
+
+class CopyArtifactsThrottleTest(CopyArtifactsTestCase):
+    """
+    Tests to check that artifacts are transferred when throttled and at
+    idle priority
+    """
+    def setUp(self):
+        super(CopyArtifactsThrottleTest, self).setUp()
+
+        self._create_flat_import_dir()
+        self._setup_import_session(autotag=False)
+
+        self.stats_file = os.path.join(self.temp_dir, b'stats.json')
+        config['copyartifacts']['stats_file'] = self.stats_file.decode('utf8')
+
+    def test_throttled_copy(self):
+        config['copyartifacts']['bytes_per_second'] = 10 ** 6
+        config['copyartifacts']['files_per_second'] = 100
+
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file2')
+        with open(self.stats_file) as f:
+            self.assertTrue('throttle' in json.load(f)['durations'])
+
+    @unittest.skipIf(not hasattr(os, 'getpriority'), 'os.getpriority is not available')
+    def test_idle_priority_kept_off_calling_thread(self):
+        config['copyartifacts']['idle_priority'] = True
+        priority = os.getpriority(os.PRIO_PROCESS, 0)
+        lowered = []
+        idle_priority = copyartifacts.idle_priority
+
+        def record():
+            lowered.append(threading.current_thread())
+            return idle_priority()
+
+        with patch.object(copyartifacts, 'idle_priority', side_effect=record):
+            self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assertEqual(len(lowered), 1)
+        self.assertTrue(lowered[0] is not threading.current_thread())
+        self.assertEqual(os.getpriority(os.PRIO_PROCESS, 0), priority)
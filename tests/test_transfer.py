@@ -0,0 +1,44 @@
+import os
+import sys
+
+from tests.helper import CopyArtifactsTestCase
+from beets import config
+
+class CopyArtifactsTransferTest(CopyArtifactsTestCase):
+    """
+    Tests to check the transfer option for linking artifacts
+    """
+    def setUp(self):
+        super(CopyArtifactsTransferTest, self).setUp()
+
+        self._create_flat_import_dir()
+        self._setup_import_session(autotag=False)
+
+        config['copyartifacts']['extensions'] = '.file'
+
+    def test_hardlink(self):
+        config['copyartifacts']['transfer'] = 'hardlink'
+
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_in_import_dir(b'the_album', b'artifact.file')
+        self.assertTrue(os.path.samefile(
+            os.path.join(self.lib_dir, b'Tag Artist', b'Tag Album', b'artifact.file'),
+            os.path.join(self.import_dir, b'the_album', b'artifact.file')))
+
+    def test_symlink(self):
+        config['copyartifacts']['transfer'] = 'symlink'
+
+        self._run_importer()
+
+        self.assertTrue(os.path.islink(
+            os.path.join(self.lib_dir, b'Tag Artist', b'Tag Album', b'artifact.file')))
+
+    def test_reflink_or_copy(self):
+        config['copyartifacts']['transfer'] = 'reflink'
+
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_in_import_dir(b'the_album', b'artifact.file')
@@ -0,0 +1,50 @@
+import os
+import sys
+
+from tests.helper import CopyArtifactsTestCase
+from beets import config
+
+class CopyArtifactsWorkersTest(CopyArtifactsTestCase):
+    """
+    Tests to check that artifacts are transferred correctly by a pool of
+    worker threads
+    """
+    def setUp(self):
+        super(CopyArtifactsWorkersTest, self).setUp()
+
+        self._create_flat_import_dir()
+        album_path = os.path.join(self.import_dir, b'the_album')
+        for i in range(10):
+            with open(os.path.join(album_path, b'artifact%d.file' % i), 'w') as f:
+                f.write(str(i))
+
+        self._setup_import_session(autotag=False)
+
+        config['copyartifacts']['workers'] = 4
+
+    def test_copy_with_workers(self):
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file')
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact.file2')
+        for i in range(10):
+            self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact%d.file' % i)
+        self.assert_in_import_dir(b'the_album', b'artifact.file')
+
+    def test_move_with_workers(self):
+        config['import']['move'] = True
+
+        self._run_importer()
+
+        for i in range(10):
+            self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'artifact%d.file' % i)
+        self.assert_not_in_import_dir(b'the_album')
+
+    def test_rename_collisions_get_unique_names(self):
+        config['paths']['ext:file'] = str('$albumpath/$album')
+
+        self._run_importer()
+
+        self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'Tag Album.file')
+        for i in range(1, 11):
+            self.assert_in_lib_dir(b'Tag Artist', b'Tag Album', b'Tag Album.%d.file' % i)